@@ -0,0 +1,20 @@
+"""
+Shared pytest configuration for the Repogent test suites.
+"""
+import sys
+from pathlib import Path
+
+# Make the scripts importable as top-level modules, as the workflows run them
+SCRIPTS_DIR = str(Path(__file__).resolve().parent / 'scripts')
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus):
+    """Print the suite summary banner after pytest's own report"""
+    terminalreporter.write_line("=" * 60)
+    if exitstatus == 0:
+        terminalreporter.write_line("✅ ALL TESTS PASSED!")
+    else:
+        terminalreporter.write_line("❌ SOME TESTS FAILED")
+    terminalreporter.write_line("=" * 60)
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Comment Library for Repogent
+Shared GitHub comment helpers and LLM response generation used by the
+comment-handling entry scripts.
+"""
+import os
+import sys
+import json
+import re
+import tempfile
+from datetime import datetime, timedelta
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import json_compat
+import response_cache
+
+# Import shared constants
+from config_constants import (
+    MAX_CONVERSATION_CONTEXT,
+    HTTP_TIMEOUT_SECONDS,
+    MODEL_COMMENT_RESPONSE
+)
+
+# Static system prompt - kept constant so it forms a cacheable prompt prefix
+RESPONSE_SYSTEM_PROMPT = """You are Repogent, a helpful AI assistant for GitHub repositories. 
+Your role is to provide helpful, technical responses to issue comments.
+
+Guidelines:
+- Be concise and technical
+- Provide actionable advice when possible
+- Ask clarifying questions if needed
+- Reference code, documentation, or error messages
+- Be friendly but professional
+
+Keep responses under 300 words."""
+
+# Shared constants for comment handling
+MAX_RESPONSE_LENGTH = 5000  # Maximum response length
+MIN_ACTIONABLE_COMMENT_LENGTH = 10  # Shorter comments ("+1", "thanks") get no LLM reply
+PENDING_WINDOW_SECONDS = 15 * 60  # Unanswered comments older than this (relative to the newest) are context, not questions
+
+# Footer of every comment response; marks Repogent's own replies in a thread
+# (other bots, including the triage comment, are not answers to a question)
+RESPONSE_SIGNATURE = "*🤖 Response generated by Repogent AI powered by Groq*"
+
+# Comments the issue-triage workflow never responds to: mentions handled by the
+# community assistant, and explicit opt-outs (matched case-insensitively, like
+# the workflow's contains())
+EXCLUDED_COMMENT_MARKERS = ('@repogent', '[skip-triage]')
+
+# Headers shared by every GitHub API call (Authorization is added per request)
+GITHUB_HEADERS = {
+    'Accept': 'application/vnd.github+json',
+    'User-Agent': 'Repogent-Bot/1.0'
+}
+
+# Comments made only of emoji/punctuation
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+# Known bot name patterns plus the GitHub App "[bot]" suffix, matched in one pass
+_BOT_RE = re.compile(
+    r'github-actions|dependabot|renovate|greenkeeper|codecov|repogent|\[bot\]$',
+    re.IGNORECASE
+)
+
+GITHUB_GRAPHQL_URL = "https://api.github.com/graphql"
+
+# Comment ETags live beside the response cache, which the workflows restore
+# between runs with actions/cache ($RUNNER_TEMP is wiped after every job)
+ETAG_CACHE_DIR = '.repogent/cache/etags'
+
+# Issue title/body and the latest comments in a single round trip
+ISSUE_WITH_COMMENTS_QUERY = """
+query($owner: String!, $name: String!, $number: Int!, $k: Int!) {
+  repository(owner: $owner, name: $name) {
+    issue(number: $number) {
+      title
+      body
+      comments(last: $k) {
+        nodes { databaseId author { login __typename } body createdAt }
+      }
+    }
+  }
+}
+"""
+
+# Shared session so GitHub calls reuse one keep-alive TLS connection
+_SESSION = requests.Session()
+_SESSION.headers.update(GITHUB_HEADERS)
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=10,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+))
+
+def is_bot_user(username: str, user_type: str = '') -> bool:
+    """Consistently detect bot users across all scripts"""
+    # Defensive check: ensure username is not None or empty
+    return user_type == 'Bot' or (bool(username) and _BOT_RE.search(username) is not None)
+
+
+def _etag_cache_path(repo, issue_number):
+    """Path of the on-disk ETag cache for an issue's comments"""
+    return os.path.join(ETAG_CACHE_DIR, f"{repo.replace('/', '_')}-{issue_number}.json")
+
+def _load_etag_cache(path):
+    """Load a cached {'etag', 'conversation'} entry, or None if unusable"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    if not isinstance(cached, dict) or not cached.get('etag') or not isinstance(cached.get('conversation'), list):
+        return None
+    return cached
+
+def _save_etag_cache(path, etag, conversation):
+    """Atomically persist the ETag and parsed conversation (best effort)"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(mode='w', encoding='utf-8',
+                                         dir=os.path.dirname(path), delete=False) as tmp:
+            json.dump({'etag': etag, 'conversation': conversation}, tmp)
+            tmp_path = tmp.name
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️ Could not write ETag cache: {e}", file=sys.stderr)
+
+def is_trivial(body: str) -> bool:
+    """Detect comments not worth an LLM reply: very short, emoji/punctuation only, or /commands"""
+    s = body.strip()
+    return (len(s) < MIN_ACTIONABLE_COMMENT_LENGTH
+            or _NON_WORD_RE.fullmatch(s) is not None
+            or s.startswith('/'))
+
+def get_issue_comments(token, repo, issue_number):
+    """Get all comments from the issue, with bot comments flagged as 'is_bot'"""
+    url = f"https://api.github.com/repos/{repo}/issues/{issue_number}/comments"
+    headers = {'Authorization': f'Bearer {token}'}
+    
+    # Conditional GET - a 304 costs no rate limit and carries no body
+    cache_path = _etag_cache_path(repo, issue_number)
+    cached = _load_etag_cache(cache_path)
+    if cached:
+        headers['If-None-Match'] = cached['etag']
+    
+    try:
+        response = _SESSION.get(url, headers=headers, timeout=HTTP_TIMEOUT_SECONDS)
+        if response.status_code == 304 and cached:
+            return cached['conversation']
+        response.raise_for_status()
+        comments = json_compat.loads(response.content)
+    except requests.exceptions.Timeout:
+        print(f"Error fetching issue comments: timeout after {HTTP_TIMEOUT_SECONDS}s")
+        return []
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching issue comments: {e}")
+        return []
+    except json.JSONDecodeError as e:
+        print(f"Error decoding comments response: {e}")
+        return []
+    conversation = []
+    for comment in comments:
+        # Safe dict access with validation
+        if not isinstance(comment, dict):
+            continue
+        
+        user = comment.get('user', {})
+        if not isinstance(user, dict):
+            continue
+            
+        author = user.get('login', 'unknown')
+        user_type = user.get('type', '')
+        body = comment.get('body', '')
+        created_at = comment.get('created_at', '')
+        
+        # Use consistent bot detection; bot replies stay in the list so
+        # split_pending() can tell which comments are still unanswered
+        conversation.append({
+            'id': comment.get('id'),
+            'author': author,
+            'body': body,
+            'created_at': created_at,
+            'is_bot': is_bot_user(author, user_type)
+        })
+    
+    etag = response.headers.get('ETag')
+    if etag:
+        _save_etag_cache(cache_path, etag, conversation)
+    return conversation
+
+def fetch_issue_with_comments(token, repo, issue_number):
+    """
+    Fetch issue title, body and recent comments with one GraphQL query.
+    Returns a dict with 'title', 'body' and 'conversation', or None on failure.
+    """
+    owner, _, name = repo.partition('/')
+    query = {
+        'query': ISSUE_WITH_COMMENTS_QUERY,
+        'variables': {
+            'owner': owner,
+            'name': name,
+            'number': issue_number,
+            'k': MAX_CONVERSATION_CONTEXT + 5
+        }
+    }
+    headers = {'Authorization': f'bearer {token}'}
+    
+    try:
+        response = _SESSION.post(GITHUB_GRAPHQL_URL, headers=headers, json=query, timeout=HTTP_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        result = response.json()
+    except requests.exceptions.Timeout:
+        print(f"Error fetching issue via GraphQL: timeout after {HTTP_TIMEOUT_SECONDS}s")
+        return None
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching issue via GraphQL: {e}")
+        return None
+    except json.JSONDecodeError as e:
+        print(f"Error decoding GraphQL response: {e}")
+        return None
+    
+    # GraphQL reports errors in the body with a 200 status
+    if not isinstance(result, dict) or result.get('errors'):
+        print(f"GraphQL error: {result.get('errors') if isinstance(result, dict) else result}")
+        return None
+    issue = ((result.get('data') or {}).get('repository') or {}).get('issue')
+    if not isinstance(issue, dict):
+        return None
+    
+    conversation = []
+    for node in (issue.get('comments') or {}).get('nodes') or []:
+        if not isinstance(node, dict):
+            continue
+        # Deleted accounts ("ghost") come back with a null author
+        author_obj = node.get('author') or {}
+        author = author_obj.get('login', 'unknown')
+        conversation.append({
+            'id': node.get('databaseId'),
+            'author': author,
+            'body': node.get('body', ''),
+            'created_at': node.get('createdAt', ''),
+            'is_bot': is_bot_user(author, author_obj.get('__typename', ''))
+        })
+    
+    return {
+        'title': issue.get('title') or '',
+        'body': issue.get('body') or '',
+        'conversation': conversation
+    }
+
+def is_excluded(comment):
+    """Comments the issue-triage workflow skips: bot logins, @repogent mentions and [skip-triage]"""
+    body = (comment.get('body') or '').lower()
+    return ('bot' in (comment.get('author') or '').lower()
+            or any(marker in body for marker in EXCLUDED_COMMENT_MARKERS))
+
+def _parse_timestamp(value):
+    """Parse a GitHub ISO 8601 timestamp, or None if it is missing or malformed"""
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def is_repogent_reply(comment):
+    """True for a comment response posted by Repogent (a bot comment carrying RESPONSE_SIGNATURE)"""
+    return bool(comment.get('is_bot')) and RESPONSE_SIGNATURE in (comment.get('body') or '')
+
+def split_pending(conversation):
+    """
+    Split a conversation at Repogent's last reply.
+    Returns (history, pending): the human comments up to that reply, and the
+    actionable human comments after it that are still waiting for an answer -
+    several of them when comment events arrive in a burst. Comments the
+    workflow excludes are never pending, and ones posted more than
+    PENDING_WINDOW_SECONDS before the newest pending comment (e.g. when no
+    reply is within the fetched window) move to history instead.
+    """
+    last_reply = -1
+    for i, comment in enumerate(conversation):
+        if is_repogent_reply(comment):
+            last_reply = i
+    
+    history = [c for c in conversation[:last_reply + 1] if not c.get('is_bot')]
+    pending = [c for c in conversation[last_reply + 1:]
+               if not c.get('is_bot') and not is_excluded(c) and not is_trivial(c.get('body') or '')]
+    
+    times = [_parse_timestamp(c.get('created_at')) for c in pending]
+    known = [t for t in times if t is not None]
+    if known:
+        cutoff = max(known) - timedelta(seconds=PENDING_WINDOW_SECONDS)
+        history += [c for c, t in zip(pending, times) if t is not None and t < cutoff]
+        pending = [c for c, t in zip(pending, times) if t is None or t >= cutoff]
+    return history, pending
+
+def build_response_messages(issue_title, issue_body, pending, context_history):
+    """
+    Build the chat messages for a comment response.
+    Ordered from most to least stable (system prompt, issue header, prior
+    comments, latest comments) so the prefix stays byte-identical across calls
+    on the same issue and can be served from provider prompt caches.
+    """
+    messages = [
+        {"role": "system", "content": RESPONSE_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Issue Title: {issue_title}\n\nIssue Description:\n{issue_body}"}
+    ]
+    
+    if context_history:
+        parts = ["Previous Comments:\n"]
+        for msg in context_history[-MAX_CONVERSATION_CONTEXT:]:
+            author = msg.get('author', 'unknown')
+            body = msg.get('body', '')
+            # Safely slice with bounds check
+            body_preview = body[:200] if body else '(no content)'
+            parts.append(f"- {author}: {body_preview}\n")
+        messages.append({"role": "user", "content": ''.join(parts)})
+    
+    if len(pending) == 1:
+        latest = f"Latest Comment: {pending[0].get('body', '')}\n\nPlease provide a helpful response to this comment."
+    else:
+        parts = ["Latest Comments:\n"]
+        for msg in pending:
+            parts.append(f"- {msg.get('author', 'unknown')}: {msg.get('body', '')}\n")
+        parts.append("\nPlease provide a single helpful response that addresses all of these comments.")
+        latest = ''.join(parts)
+    messages.append({"role": "user", "content": latest})
+    return messages
+
+def generate_response(client, issue_title, issue_body, pending, context_history):
+    """Generate one intelligent response to all pending comments using Groq"""
+    
+    messages = build_response_messages(issue_title, issue_body, pending, context_history)
+    
+    # Reuse a previous answer to the same question in the same conversation state
+    # (everything except the latest comments is the context fingerprint)
+    cache_key_text = '\n'.join([issue_title] + [msg.get('body', '') for msg in pending])
+    context = '\n'.join(message['content'] for message in messages[1:-1])
+    cached = response_cache.lookup(cache_key_text, context)
+    if cached:
+        print("♻️ Using cached response", file=sys.stderr)
+        return cached
+    
+    try:
+        response = client.chat.completions.create(
+            messages=messages,
+            model=os.getenv('GROQ_MODEL', MODEL_COMMENT_RESPONSE),
+            max_tokens=1024,
+            temperature=0.7,
+            stream=True
+        )
+        
+        # Accumulate deltas and stop the stream as soon as we have more than
+        # main() will keep - the remaining tokens would only be truncated away
+        chunks = []
+        total_len = 0
+        try:
+            for chunk in response:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                chunks.append(delta)
+                total_len += len(delta)
+                if total_len > MAX_RESPONSE_LENGTH:
+                    break
+        finally:
+            response.close()
+        
+        content = ''.join(chunks)
+        if not content:
+            print(f"⚠️ Empty response content from LLM", file=sys.stderr)
+            return None
+        
+        content = content.strip()
+        response_cache.store(cache_key_text, content, context)
+        return content
+        
+    except Exception as e:
+        print(f"❌ Response generation error: {e}", file=sys.stderr)
+        return None
+
+def post_comment(token, repo, issue_number, body):
+    """Post a comment to the issue"""
+    url = f"https://api.github.com/repos/{repo}/issues/{issue_number}/comments"
+    headers = {'Authorization': f'Bearer {token}'}
+    
+    try:
+        response = _SESSION.post(url, headers=headers, json={'body': body}, timeout=HTTP_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.Timeout:
+        print(f"Error posting comment: timeout after {HTTP_TIMEOUT_SECONDS}s")
+        return None
+    except requests.exceptions.RequestException as e:
+        print(f"Error posting comment: {e}")
+        return None
+    except json.JSONDecodeError as e:
+        print(f"Error decoding post response: {e}")
+        return None
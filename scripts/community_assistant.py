@@ -5,11 +5,9 @@ Helps users navigate the codebase by answering questions with code references an
 """
 import os
 import sys
-import json
 import re
 from pathlib import Path
 from groq import Groq
-import requests
 
 # Import shared constants
 from config_constants import (
@@ -19,12 +17,14 @@ from config_constants import (
     CONTEXT_LINES,
     MAX_SEARCH_RESULTS,
     MAX_RESPONSE_LENGTH,
-    HTTP_TIMEOUT_SECONDS,
     CODE_EXTENSIONS,
     SKIP_DIRS,
     MODEL_COMMUNITY_QA
 )
 
+# Shared comment helpers
+from comment_lib import is_bot_user, post_comment
+
 __version__ = "1.0.0"
 
 
@@ -308,44 +308,6 @@ Please answer the question using the code references above. Include the permalin
         return f"I found these relevant code sections:\n\n{code_context}"
 
 
-def post_comment(token, repo, issue_number, body):
-    """Post a comment to the issue"""
-    url = f"https://api.github.com/repos/{repo}/issues/{issue_number}/comments"
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Accept': 'application/vnd.github+json',
-        'User-Agent': 'Repogent-Bot/1.0'
-    }
-    
-    try:
-        response = requests.post(url, headers=headers, json={'body': body}, timeout=HTTP_TIMEOUT_SECONDS)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.Timeout:
-        print(f"Error posting comment: timeout after {HTTP_TIMEOUT_SECONDS}s")
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"Error posting comment: {e}")
-        return None
-    except json.JSONDecodeError as e:
-        print(f"Error decoding response: {e}")
-        return None
-
-
-def is_bot_user(username: str, user_type: str = '') -> bool:
-    """Consistently detect bot users across all scripts"""
-    if user_type == 'Bot':
-        return True
-    # Defensive check: ensure username is not None or empty
-    if not username:
-        return False
-    if username.endswith('[bot]'):
-        return True
-    # Whitelist known bot patterns (more specific than substring matching)
-    bot_names = ['github-actions', 'dependabot', 'renovate', 'greenkeeper', 'codecov', 'repogent']
-    return any(bot in username.lower() for bot in bot_names)
-
-
 def extract_question(comment_body):
     """
     Extract the actual question from a comment that mentions @repogent.
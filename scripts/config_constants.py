@@ -3,6 +3,7 @@
 Shared Configuration Constants for Repogent
 Centralized configuration to avoid magic numbers across modules.
 """
+import os
 
 __version__ = "1.0.0"
 
@@ -18,6 +19,10 @@ MODEL_ISSUE_TRIAGE = "llama-3.3-70b-versatile"
 MODEL_COMMUNITY_QA = "llama-3.3-70b-versatile"
 MODEL_COMMENT_RESPONSE = "llama-3.3-70b-versatile"
 
+# Inputs shorter than this (in characters) may be routed to the small model
+# named by the MODEL_SMALL env var - see pick_model()
+SMALL_INPUT_CHARS = 4000
+
 # ============================================================================
 # Size Limits
 # ============================================================================
@@ -30,6 +35,9 @@ MAX_QUEUE_DEPTH = 100  # Maximum messages in queue before eviction
 MAX_CONTEXT_SIZE_BYTES = 1024 * 1024  # 1MB per context file
 MAX_CONTEXT_FILES = 1000  # Maximum number of context files
 
+# Response cache limits
+MAX_RESPONSE_CACHE_ENTRIES = 500  # Maximum cached LLM responses before eviction
+
 # File processing limits
 MAX_FILE_SIZE = 100 * 1024  # 100KB limit per file for indexing
 MAX_TOTAL_INDEX_SIZE = 50 * 1024 * 1024  # 50MB total index size
@@ -40,6 +48,10 @@ MAX_LOG_SIZE_BYTES = 1024 * 1024  # 1MB max log size to analyze
 MAX_RESPONSE_LENGTH = 65000  # Maximum response length in characters
 MAX_ERROR_DETAILS = 5  # Maximum error details to extract
 
+# LLM output token caps (env MAX_OUTPUT_TOKENS_* overrides)
+MAX_OUTPUT_TOKENS_REVIEW = 2048  # Review list for one diff shard, with room for many findings
+MAX_OUTPUT_TOKENS_TRIAGE = 96  # {"classification", "reason"} object
+
 # ============================================================================
 # Timeout Configuration
 # ============================================================================
@@ -97,6 +109,28 @@ def get_model_for_task(task: str) -> str:
     return models.get(task, MODEL_PR_REVIEW)
 
 
+def pick_model(text: str, default: str) -> str:
+    """
+    Pick the cheapest adequate model for an input.
+    
+    Args:
+        text: The variable part of the prompt (diff, issue text)
+        default: Model to use for large inputs when MODEL_LARGE is unset
+    
+    Returns:
+        FORCE_MODEL if set; MODEL_SMALL for inputs under SMALL_INPUT_CHARS
+        when set; otherwise MODEL_LARGE or the default. Small-model routing
+        is opt-in since there is no fast tier we can rely on being deployed.
+    """
+    forced = os.environ.get('FORCE_MODEL')
+    if forced:
+        return forced
+    small = os.environ.get('MODEL_SMALL')
+    if small and len(text) < SMALL_INPUT_CHARS:
+        return small
+    return os.environ.get('MODEL_LARGE') or default
+
+
 def get_truncation_sizes(total_size: int) -> tuple:
     """
     Calculate head and tail sizes for log truncation.
@@ -13,36 +13,49 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 import os
 import sys
 import json
 import requests
 import re
+from bisect import bisect_left
 
 # Constants
 HTTP_TIMEOUT_SECONDS = 30  # HTTP request timeout
 MAX_INLINE_COMMENTS = 50  # Maximum inline comments per review
 LINE_DISTANCE_THRESHOLD = 3  # Maximum distance for approximate line matches
+GENERAL_COMMENT_SEPARATOR = "\n\n---\n\n"  # Separator between general comment parts
+
+# Diff parsing patterns (operate on raw bytes so the diff never needs decoding)
+_FILE_HEADER_RE = re.compile(rb'\+\+\+ b/(.*)')
+_HUNK_RE = re.compile(rb'@@ -\d+(?:,\d+)? \+(\d+)(?:,\d+)? @@')
 
 def parse_diff_for_line_mapping(diff_text):
     """
     Parse git diff to map file paths to changed and context line numbers.
-    Returns a dict: {file_path: {'added': [lines], 'context': [lines], 'all': [lines]}}
+    Accepts the diff as bytes (preferred) or str.
+    Returns a dict: {file_path: {'added': {lines}, 'all': {lines}}}
+    where 'all' holds both added and context lines of the new file.
     """
+    if isinstance(diff_text, str):
+        diff_text = diff_text.encode('utf-8', errors='replace')
+    
     file_lines = {}
     current_file = None
     current_line = 0
     
-    for line in diff_text.split('\n'):
+    for line in diff_text.split(b'\n'):
         # New file - reset state
-        if line.startswith('diff --git'):
+        if line.startswith(b'diff --git'):
             current_file = None
             current_line = 0
-        elif line.startswith('+++'):
+        elif line.startswith(b'+++'):
             # Extract file path (remove +++ b/ prefix), skip deleted files
-            match = re.match(r'\+\+\+ b/(.*)', line)
+            match = _FILE_HEADER_RE.match(line)
             if match:
-                file_path = match.group(1)
+                # Only the path itself needs decoding
+                file_path = match.group(1).decode('utf-8', errors='replace')
                 # Skip /dev/null (deleted files) or empty paths
                 if file_path == '/dev/null' or not file_path or not file_path.strip():
                     current_file = None
@@ -50,30 +63,28 @@ def parse_diff_for_line_mapping(diff_text):
                 current_file = file_path
                 if current_file not in file_lines:
                     file_lines[current_file] = {
-                        'added': [],
-                        'context': [],
-                        'all': []
+                        'added': set(),
+                        'all': set()
                     }
-        elif line.startswith('@@'):
+        elif line.startswith(b'@@'):
             # Parse hunk header: @@ -old_start,old_count +new_start,new_count @@
             # Only process if we have a valid current_file
             if current_file is not None:
-                match = re.match(r'@@ -\d+(?:,\d+)? \+(\d+)(?:,\d+)? @@', line)
+                match = _HUNK_RE.match(line)
                 if match:
                     current_line = int(match.group(1))
         elif current_file is not None and current_line > 0:
-            if line.startswith('+') and not line.startswith('+++'):
+            if line.startswith(b'+') and not line.startswith(b'+++'):
                 # Added line
-                file_lines[current_file]['added'].append(current_line)
-                file_lines[current_file]['all'].append(current_line)
+                file_lines[current_file]['added'].add(current_line)
+                file_lines[current_file]['all'].add(current_line)
                 current_line += 1
-            elif line.startswith('-') and not line.startswith('---'):
+            elif line.startswith(b'-') and not line.startswith(b'---'):
                 # Removed line - don't increment current_line (refers to new file)
                 pass
-            elif line.startswith(' '):
+            elif line.startswith(b' '):
                 # Context line (space prefix) - these exist in both old and new file
-                file_lines[current_file]['context'].append(current_line)
-                file_lines[current_file]['all'].append(current_line)
+                file_lines[current_file]['all'].add(current_line)
                 current_line += 1
             # Empty lines in diff output are typically between hunks or at end
             # Don't treat them as actual file lines to avoid off-by-one errors
@@ -81,18 +92,23 @@ def parse_diff_for_line_mapping(diff_text):
     
     return file_lines
 
+# Severity emoji lookup covering the common casings so no .upper() is needed
+_EMOJI_MAP = {
+    key: emoji
+    for base, emoji in (('CRITICAL', '🔴'), ('WARNING', '🟡'), ('SUGGESTION', '🟢'), ('INFO', '💡'))
+    for key in (base, base.lower(), base.title())
+}
+
 def severity_emoji(severity):
     """Return emoji for severity level"""
-    emoji_map = {
-        'CRITICAL': '🔴',
-        'WARNING': '🟡',
-        'SUGGESTION': '🟢',
-        'INFO': '💡'
-    }
     # Safe handling of None or non-string severity
-    if severity is None or not isinstance(severity, str):
+    if not isinstance(severity, str):
         return '💬'
-    return emoji_map.get(severity.upper(), '💬')
+    emoji = _EMOJI_MAP.get(severity)
+    if emoji is None:
+        # Unusual casing (e.g. "cRiTiCaL") - normalize only on this slow path
+        emoji = _EMOJI_MAP.get(severity.upper(), '💬')
+    return emoji
 
 def format_review_comment(review):
     """Format a review comment with severity and suggestion"""
@@ -108,6 +124,40 @@ def format_review_comment(review):
     
     return comment
 
+def build_review_body(review_title, parts):
+    """Join general comment parts under the review title in a single buffer"""
+    buf = io.StringIO()
+    buf.write(review_title)
+    buf.write("\n\n")
+    first = True
+    for part in parts:
+        if not first:
+            buf.write(GENERAL_COMMENT_SEPARATOR)
+        buf.write(part)
+        first = False
+    return buf.getvalue()
+
+def _nearest_line(sorted_lines, line):
+    """Return the entry of a non-empty sorted list closest to line (lower wins ties)"""
+    i = bisect_left(sorted_lines, line)
+    if i == 0:
+        return sorted_lines[0]
+    if i == len(sorted_lines):
+        return sorted_lines[-1]
+    before, after = sorted_lines[i - 1], sorted_lines[i]
+    return before if line - before <= after - line else after
+
+def _log_request_failure(e):
+    """Log a failed review POST, including the response body when available"""
+    print(f"❌ Failed to post review: {e}", file=sys.stderr)
+    response = getattr(e, 'response', None)
+    if response is None:
+        return
+    try:
+        print(f"Response: {response.text}", file=sys.stderr)
+    except Exception:
+        print(f"Response code: {getattr(response, 'status_code', 'unknown')}", file=sys.stderr)
+
 def post_review_comments(github_token, repo, pr_number, commit_sha, reviews, diff_text):
     """
     Post inline review comments to GitHub PR.
@@ -119,6 +169,10 @@ def post_review_comments(github_token, repo, pr_number, commit_sha, reviews, dif
     # Prepare review comments
     comments = []
     general_comment_parts = []
+    # Sorted nearest-line candidates per file, built once on first use
+    sorted_candidates = {}
+    # (file, line, message prefix) keys already seen, to drop duplicate LLM output
+    seen_reviews = set()
     
     # Validate reviews is a list
     if not isinstance(reviews, list):
@@ -136,9 +190,19 @@ def post_review_comments(github_token, repo, pr_number, commit_sha, reviews, dif
         except (ValueError, TypeError):
             line = 0
         
+        # Skip duplicates (LLMs often repeat the same finding)
+        message = review.get('message', '')
+        review_key = (file, line, message[:200] if isinstance(message, str) else str(message))
+        if review_key in seen_reviews:
+            continue
+        seen_reviews.add(review_key)
+        
+        # Format once and reuse across all placement strategies below
+        formatted = format_review_comment(review)
+        
         # Skip error entries
         if file in ['error', 'general'] or line == 0:
-            general_comment_parts.append(format_review_comment(review))
+            general_comment_parts.append(formatted)
             continue
         
         # Try to find the best line to comment on
@@ -148,29 +212,29 @@ def post_review_comments(github_token, repo, pr_number, commit_sha, reviews, dif
             
             # Additional safety check - ensure we have lines to work with
             if not available_lines:
-                general_comment_parts.append(f"**{file}:{line}**\n{format_review_comment(review)}")
+                general_comment_parts.append(f"**{file}:{line}**\n{formatted}")
                 continue
             
             # Strategy 1: Exact match - use directly, no distance check needed
             if line in available_lines:
-                comment_body = format_review_comment(review)
                 comments.append({
                     'path': file,
                     'line': line,
-                    'body': comment_body
+                    'body': formatted
                 })
             # Strategy 2: Find closest available line
             else:
                 # Prefer added lines over context lines
-                if added_lines:
-                    target_line = min(added_lines, key=lambda x: abs(x - line))
-                else:
-                    target_line = min(available_lines, key=lambda x: abs(x - line))
+                candidates = sorted_candidates.get(file)
+                if candidates is None:
+                    candidates = sorted(added_lines or available_lines)
+                    sorted_candidates[file] = candidates
+                target_line = _nearest_line(candidates, line)
                 
                 distance = abs(target_line - line)
                 # Use constant for threshold
                 if distance <= LINE_DISTANCE_THRESHOLD:
-                    comment_body = f"*Note: Original line {line} not in diff, commenting on nearest changed line {target_line}*\n\n" + format_review_comment(review)
+                    comment_body = f"*Note: Original line {line} not in diff, commenting on nearest changed line {target_line}*\n\n" + formatted
                     comments.append({
                         'path': file,
                         'line': target_line,
@@ -178,10 +242,10 @@ def post_review_comments(github_token, repo, pr_number, commit_sha, reviews, dif
                     })
                 else:
                     # Too far, use general comment
-                    general_comment_parts.append(f"**{file}:~{line}** *(line not in diff)*\n{format_review_comment(review)}")
+                    general_comment_parts.append(f"**{file}:~{line}** *(line not in diff)*\n{formatted}")
         else:
             # File not in diff or no available lines
-            general_comment_parts.append(f"**{file}:{line}**\n{format_review_comment(review)}")
+            general_comment_parts.append(f"**{file}:{line}**\n{formatted}")
     
     # Create the review
     api_url = f"https://api.github.com/repos/{repo}/pulls/{pr_number}/reviews"
@@ -191,6 +255,15 @@ def post_review_comments(github_token, repo, pr_number, commit_sha, reviews, dif
         'User-Agent': 'Repogent-Bot/1.0'
     }
     
+    # Limit inline comments to avoid overwhelming the review
+    if len(comments) > MAX_INLINE_COMMENTS:
+        print(f"⚠️ Too many inline comments ({len(comments)}), limiting to {MAX_INLINE_COMMENTS}", file=sys.stderr)
+        # Move excess comments to general comments
+        excess_comments = comments[MAX_INLINE_COMMENTS:]
+        for comment in excess_comments:
+            general_comment_parts.append(f"**{comment['path']}:{comment['line']}**\n{comment['body']}")
+        comments = comments[:MAX_INLINE_COMMENTS]
+    
     review_data = {
         'commit_id': commit_sha,
         'event': 'COMMENT'
@@ -203,20 +276,7 @@ def post_review_comments(github_token, repo, pr_number, commit_sha, reviews, dif
     # Add general comment body if there are general issues
     if general_comment_parts:
         review_title = os.environ.get('REVIEW_TITLE', '# Code Review by Repogent AI')
-        review_data['body'] = f"{review_title}\n\n" + "\n\n---\n\n".join(general_comment_parts)
-    
-    # Limit inline comments to avoid overwhelming the review
-    if len(comments) > MAX_INLINE_COMMENTS:
-        print(f"⚠️ Too many inline comments ({len(comments)}), limiting to {MAX_INLINE_COMMENTS}", file=sys.stderr)
-        # Move excess comments to general comments
-        excess_comments = comments[MAX_INLINE_COMMENTS:]
-        for comment in excess_comments:
-            general_comment_parts.append(f"**{comment['path']}:{comment['line']}**\n{comment['body']}")
-        comments = comments[:MAX_INLINE_COMMENTS]
-        # Update review data
-        review_data['comments'] = comments
-        review_title = os.environ.get('REVIEW_TITLE', '# Code Review by Repogent AI')
-        review_data['body'] = f"{review_title}\n\n" + "\n\n---\n\n".join(general_comment_parts)
+        review_data['body'] = build_review_body(review_title, general_comment_parts)
     
     # Only post if we have comments or a body
     if comments or general_comment_parts:
@@ -229,12 +289,7 @@ def post_review_comments(github_token, repo, pr_number, commit_sha, reviews, dif
             print(f"❌ Timeout posting review (>{HTTP_TIMEOUT_SECONDS}s)", file=sys.stderr)
             return False
         except requests.exceptions.RequestException as e:
-            print(f"❌ Failed to post review: {e}", file=sys.stderr)
-            if hasattr(e, 'response') and e.response is not None:
-                try:
-                    print(f"Response: {e.response.text}", file=sys.stderr)
-                except Exception:
-                    print(f"Response code: {e.response.status_code if hasattr(e.response, 'status_code') else 'unknown'}", file=sys.stderr)
+            _log_request_failure(e)
             return False
     else:
         print("✅ No issues found - PR looks good!", file=sys.stderr)
@@ -275,11 +330,12 @@ def main():
     # Read diff file
     diff_file = 'diff.txt'
     try:
-        with open(diff_file, 'r', encoding='utf-8', errors='replace') as f:
+        # Read raw bytes - the parser only inspects ASCII prefixes
+        with open(diff_file, 'rb') as f:
             diff_text = f.read()
     except FileNotFoundError:
         print(f"Diff file not found: {diff_file}", file=sys.stderr)
-        diff_text = ""
+        diff_text = b""
     
     # Post comments
     success = post_review_comments(github_token, repo, pr_number, commit_sha, reviews, diff_text)
@@ -7,12 +7,20 @@ import os
 import sys
 import json
 from typing import Dict, Any, Optional, List
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import agent_comms
 import requests
+from requests.adapters import HTTPAdapter
 
 # Import shared constants
 from config_constants import HTTP_TIMEOUT_SECONDS
 
+MAX_POST_WORKERS = 4  # Concurrent comment posts when draining the inbox
+
+# Shared session so concurrent posts reuse pooled keep-alive connections
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_POST_WORKERS))
+
 
 def analyze_build_failure_context(pr_number: int, failure_data: Dict[str, Any]) -> str:
     """Analyze PR in context of build failure"""
@@ -78,55 +86,77 @@ Missing or conflicting dependencies detected. Please:
     return comment
 
 
+def _post_failure_comment(session: requests.Session, github_token: str, repo: str,
+                          pr_number: int, analysis_comment: str) -> bool:
+    """Post a build failure analysis comment to one PR"""
+    # Post as issue comment (works for PRs too)
+    url = f"https://api.github.com/repos/{repo}/issues/{pr_number}/comments"
+    headers = {
+        'Authorization': f'Bearer {github_token}',
+        'Accept': 'application/vnd.github+json',
+        'User-Agent': 'Repogent-PRReviewer/1.0'
+    }
+    
+    try:
+        response = session.post(url, headers=headers,
+                                json={'body': analysis_comment}, timeout=HTTP_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        print(f"✅ Posted build failure analysis to PR #{pr_number}", file=sys.stderr)
+        return True
+    except requests.exceptions.Timeout:
+        print(f"❌ Timeout posting comment (>{HTTP_TIMEOUT_SECONDS}s)", file=sys.stderr)
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Failed to post comment: {e}", file=sys.stderr)
+    except Exception as e:
+        print(f"❌ Unexpected error: {e}", file=sys.stderr)
+    return False
+
+
 def check_for_cicd_messages():
     """Check if there are any messages from CI/CD agent"""
     messages = agent_comms.receive_messages('pr_reviewer')
     
-    for message in messages:
-        if message.message_type == 'analyze_build_failure':
-            # Process build failure
-            payload = message.payload
-            pr_number = payload.get('pr_number')
-            
-            if pr_number:
-                print(f"📨 Received build failure notification for PR #{pr_number}", file=sys.stderr)
-                
-                # Generate analysis
-                analysis_comment = analyze_build_failure_context(pr_number, payload)
-                
-                # Post comment
-                from post_review_comments import post_comment
-                github_token = os.environ.get('GITHUB_TOKEN')
-                repo = os.environ.get('GITHUB_REPOSITORY')
-                
-                if github_token and repo:
-                    # Post as issue comment (works for PRs too)
-                    import requests
-                    url = f"https://api.github.com/repos/{repo}/issues/{pr_number}/comments"
-                    headers = {
-                        'Authorization': f'Bearer {github_token}',
-                        'Accept': 'application/vnd.github+json',
-                        'User-Agent': 'Repogent-PRReviewer/1.0'
-                    }
-                    
-                    try:
-                        response = requests.post(url, headers=headers, 
-                                               json={'body': analysis_comment}, timeout=HTTP_TIMEOUT_SECONDS)
-                        response.raise_for_status()
-                        print(f"✅ Posted build failure analysis to PR #{pr_number}", file=sys.stderr)
-                        
-                        # Log decision
-                        agent_comms.log_decision('pr_reviewer', {
-                            'action': 'build_failure_analysis',
-                            'pr_number': pr_number,
-                            'failure_type': payload.get('analysis', {}).get('failure_type')
-                        })
-                    except requests.exceptions.Timeout:
-                        print(f"❌ Timeout posting comment (>{HTTP_TIMEOUT_SECONDS}s)", file=sys.stderr)
-                    except requests.exceptions.RequestException as e:
-                        print(f"❌ Failed to post comment: {e}", file=sys.stderr)
-                    except Exception as e:
-                        print(f"❌ Unexpected error: {e}", file=sys.stderr)
+    # Only build failure messages with a PR number need a comment
+    payloads = [
+        message.payload for message in messages
+        if message.message_type == 'analyze_build_failure' and message.payload.get('pr_number')
+    ]
+    if not payloads:
+        return
+    
+    github_token = os.environ.get('GITHUB_TOKEN')
+    repo = os.environ.get('GITHUB_REPOSITORY')
+    if not github_token or not repo:
+        # The messages are already dequeued - say so rather than drop them silently
+        pr_numbers = ', '.join(f"#{payload['pr_number']}" for payload in payloads)
+        print(f"⚠️ GITHUB_TOKEN or GITHUB_REPOSITORY not set; dropping build failure "
+              f"notifications for PR {pr_numbers}", file=sys.stderr)
+        return
+    
+    # Generate analyses up front - context lookups go through the shared orchestrator
+    comments = []
+    for payload in payloads:
+        pr_number = payload['pr_number']
+        print(f"📨 Received build failure notification for PR #{pr_number}", file=sys.stderr)
+        comments.append((payload, analyze_build_failure_context(pr_number, payload)))
+    
+    # Post concurrently so draining a backlog costs ~1 RTT instead of N
+    with ThreadPoolExecutor(max_workers=MAX_POST_WORKERS) as executor:
+        futures = {
+            executor.submit(_post_failure_comment, _SESSION, github_token, repo,
+                            payload['pr_number'], comment): payload
+            for payload, comment in comments
+        }
+        for future in as_completed(futures):
+            if not future.result():
+                continue
+            payload = futures[future]
+            # Log decision from the main thread
+            agent_comms.log_decision('pr_reviewer', {
+                'action': 'build_failure_analysis',
+                'pr_number': payload['pr_number'],
+                'failure_type': payload.get('analysis', {}).get('failure_type')
+            })
 
 
 if __name__ == '__main__':
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+"""
+Progress logging for Repogent scripts
+Progress messages go to stderr; set VERBOSE=0 (or false/no/off) to keep only warnings and errors.
+"""
+import os
+import sys
+
+__version__ = "1.0.0"
+
+VERBOSE = os.environ.get('VERBOSE', '1').strip().lower() not in {'0', 'false', 'no', 'off', ''}
+
+
+def log(message):
+    """Print a progress message to stderr when VERBOSE is on"""
+    if VERBOSE:
+        print(message, file=sys.stderr)
@@ -5,170 +5,26 @@ Provides intelligent responses to issue comments
 """
 import os
 import sys
-import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from groq import Groq
 
-# Import shared constants
-from config_constants import (
-    MAX_CONVERSATION_CONTEXT,
-    HTTP_TIMEOUT_SECONDS,
-    MODEL_COMMENT_RESPONSE
+# Shared comment helpers
+from comment_lib import (
+    MAX_RESPONSE_LENGTH,
+    is_bot_user,
+    is_trivial,
+    get_issue_comments,
+    fetch_issue_with_comments,
+    split_pending,
+    is_repogent_reply,
+    RESPONSE_SIGNATURE,
+    generate_response,
+    post_comment
 )
 
-# Local constants
-MAX_RESPONSE_LENGTH = 5000  # Maximum response length
-
-def is_bot_user(username: str, user_type: str = '') -> bool:
-    """Consistently detect bot users across all scripts"""
-    if user_type == 'Bot':
-        return True
-    # Defensive check: ensure username is not None or empty
-    if not username:
-        return False
-    if username.endswith('[bot]'):
-        return True
-    # Whitelist known bot patterns (more specific than substring matching)
-    bot_names = ['github-actions', 'dependabot', 'renovate', 'greenkeeper', 'codecov', 'repogent']
-    return any(bot in username.lower() for bot in bot_names)
-
-
-def get_issue_comments(token, repo, issue_number):
-    """Get all comments from the issue, excluding bot comments"""
-    import requests
-    
-    url = f"https://api.github.com/repos/{repo}/issues/{issue_number}/comments"
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Accept': 'application/vnd.github+json',
-        'User-Agent': 'Repogent-Bot/1.0'
-    }
-    
-    try:
-        response = requests.get(url, headers=headers, timeout=HTTP_TIMEOUT_SECONDS)
-        response.raise_for_status()
-        comments = response.json()
-    except requests.exceptions.Timeout:
-        print(f"Error fetching issue comments: timeout after {HTTP_TIMEOUT_SECONDS}s")
-        return []
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching issue comments: {e}")
-        return []
-    except json.JSONDecodeError as e:
-        print(f"Error decoding comments response: {e}")
-        return []
-    conversation = []
-    for comment in comments:
-        # Safe dict access with validation
-        if not isinstance(comment, dict):
-            continue
-        
-        user = comment.get('user', {})
-        if not isinstance(user, dict):
-            continue
-            
-        author = user.get('login', 'unknown')
-        user_type = user.get('type', '')
-        body = comment.get('body', '')
-        created_at = comment.get('created_at', '')
-        
-        # Use consistent bot detection
-        if not is_bot_user(author, user_type):
-            conversation.append({
-                'author': author,
-                'body': body,
-                'created_at': created_at
-            })
-    return conversation
-
-def generate_response(client, issue_title, issue_body, comment_body, conversation_history):
-    """Generate intelligent response using Groq"""
-    
-    # Build conversation context
-    context = f"Issue Title: {issue_title}\n\nIssue Description:\n{issue_body}\n\n"
-    
-    # Exclude the most recent comment (the one we're responding to) to avoid duplication
-    if conversation_history and conversation_history[-1].get('body') == comment_body:
-        context_history = conversation_history[:-1]
-    else:
-        context_history = conversation_history
-    
-    if context_history:
-        context += "Previous Comments:\n"
-        for msg in context_history[-MAX_CONVERSATION_CONTEXT:]:
-            author = msg.get('author', 'unknown')
-            body = msg.get('body', '')
-            # Safely slice with bounds check
-            body_preview = body[:200] if body else '(no content)'
-            context += f"- {author}: {body_preview}\n"
-    
-    system_prompt = """You are Repogent, a helpful AI assistant for GitHub repositories. 
-Your role is to provide helpful, technical responses to issue comments.
-
-Guidelines:
-- Be concise and technical
-- Provide actionable advice when possible
-- Ask clarifying questions if needed
-- Reference code, documentation, or error messages
-- Be friendly but professional
-
-Keep responses under 300 words."""
-
-    user_content = f"""{context}
-
-Latest Comment: {comment_body}
-
-Please provide a helpful response to this comment."""
-
-    try:
-        response = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_content}
-            ],
-            model=os.getenv('GROQ_MODEL', MODEL_COMMENT_RESPONSE),
-            max_tokens=1024,
-            temperature=0.7
-        )
-        
-        if not response.choices:
-            print(f"⚠️ No response choices from LLM", file=sys.stderr)
-            return None
-        
-        content = response.choices[0].message.content
-        if not content:
-            print(f"⚠️ Empty response content from LLM", file=sys.stderr)
-            return None
-        
-        return content.strip()
-        
-    except Exception as e:
-        print(f"❌ Response generation error: {e}", file=sys.stderr)
-        return None
-
-def post_comment(token, repo, issue_number, body):
-    """Post a comment to the issue"""
-    import requests
-    
-    url = f"https://api.github.com/repos/{repo}/issues/{issue_number}/comments"
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Accept': 'application/vnd.github+json',
-        'User-Agent': 'Repogent-Bot/1.0'
-    }
-    
-    try:
-        response = requests.post(url, headers=headers, json={'body': body}, timeout=HTTP_TIMEOUT_SECONDS)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.Timeout:
-        print(f"Error posting comment: timeout after {HTTP_TIMEOUT_SECONDS}s")
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"Error posting comment: {e}")
-        return None
-    except json.JSONDecodeError as e:
-        print(f"Error decoding post response: {e}")
-        return None
+# Wait before reading the conversation so a burst of comments lands in one run
+DEFAULT_DEBOUNCE_SECONDS = 5
 
 def main():
     # Get environment variables
@@ -178,6 +34,7 @@ def main():
     issue_number_str = os.environ.get('ISSUE_NUMBER')
     comment_body = os.environ.get('COMMENT_BODY', '')
     comment_author = os.environ.get('COMMENT_AUTHOR', '')
+    comment_id_str = os.environ.get('COMMENT_ID', '')
     issue_title = os.environ.get('ISSUE_TITLE', '')
     issue_body = os.environ.get('ISSUE_BODY', '')
     
@@ -191,6 +48,13 @@ def main():
         print(f"Invalid issue number format: {issue_number_str}", file=sys.stderr)
         sys.exit(1)
     
+    # The event's comment id identifies the triggering comment; bodies can repeat
+    try:
+        comment_id = int(comment_id_str) if comment_id_str else None
+    except ValueError:
+        print(f"⚠️ Invalid comment id format: {comment_id_str}", file=sys.stderr)
+        comment_id = None
+    
     if not all([groq_api_key, github_token, repo, comment_body]):
         print("Missing required environment variables", file=sys.stderr)
         sys.exit(1)
@@ -205,20 +69,71 @@ def main():
         print("Comment is from a bot, skipping to avoid loops", file=sys.stderr)
         sys.exit(0)
     
-    # Initialize Groq client
-    client = Groq(api_key=groq_api_key)
+    # Skip the LLM round trip for "+1", "thanks", emoji-only or /command comments
+    if is_trivial(comment_body):
+        print("Comment is not actionable, skipping response", file=sys.stderr)
+        sys.exit(0)
     
     print(f"💬 Responding to comment on issue #{issue_number}", file=sys.stderr)
     
-    # Get conversation history
+    # Short debounce: comments posted right after this one are answered here too
     try:
-        conversation = get_issue_comments(github_token, repo, issue_number)
-    except Exception as e:
-        print(f"⚠️ Could not fetch conversation history: {e}", file=sys.stderr)
-        conversation = []
+        debounce = float(os.environ.get('COMMENT_DEBOUNCE_SECONDS', DEFAULT_DEBOUNCE_SECONDS))
+    except ValueError:
+        debounce = DEFAULT_DEBOUNCE_SECONDS
+    if debounce > 0:
+        time.sleep(debounce)
+    
+    # Get issue details and conversation history in one GraphQL request,
+    # overlapping the network wait with Groq client setup
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        fut_issue = executor.submit(fetch_issue_with_comments, github_token, repo, issue_number)
+        client = Groq(api_key=groq_api_key)
+        try:
+            issue = fut_issue.result()
+        except Exception as e:
+            print(f"⚠️ Could not fetch issue details: {e}", file=sys.stderr)
+            issue = None
+    
+    # Fall back to the REST comments endpoint and event-provided title/body
+    if issue is not None:
+        issue_title = issue['title']
+        issue_body = issue['body']
+        conversation = issue['conversation']
+    else:
+        try:
+            conversation = get_issue_comments(github_token, repo, issue_number)
+        except Exception as e:
+            print(f"⚠️ Could not fetch conversation history: {e}", file=sys.stderr)
+            conversation = []
+    
+    # Answer every comment since Repogent's last reply at once, so a burst of
+    # comment events costs one LLM call instead of one per comment
+    if comment_id is not None:
+        trigger_field, trigger_value = 'id', comment_id
+    else:
+        trigger_field, trigger_value = 'body', comment_body
+    position = next((i for i, c in enumerate(conversation) if c.get(trigger_field) == trigger_value), None)
+    if position is None:
+        # Not in the fetched conversation (fetch failed, or the REST fallback
+        # only returned the oldest page) - nothing reliable to batch against,
+        # so answer just this comment with what was fetched as context
+        history = [c for c in conversation if not c.get('is_bot')]
+        pending = [{'id': comment_id, 'author': comment_author, 'body': comment_body}]
+    else:
+        # A Repogent reply after the triggering comment means an earlier run
+        # answered it; other bot comments (e.g. the triage comment) do not count
+        if comment_id is not None and any(is_repogent_reply(c) for c in conversation[position + 1:]):
+            print("Comment was already answered by an earlier run, skipping", file=sys.stderr)
+            sys.exit(0)
+        history, pending = split_pending(conversation)
+        if not any(c.get(trigger_field) == trigger_value for c in pending):
+            pending.append(conversation[position])
+    if len(pending) > 1:
+        print(f"📦 Batching {len(pending)} pending comments into one response", file=sys.stderr)
     
     # Generate response
-    response_text = generate_response(client, issue_title, issue_body, comment_body, conversation)
+    response_text = generate_response(client, issue_title, issue_body, pending, history)
     
     if not response_text:
         print("❌ Failed to generate response", file=sys.stderr)
@@ -232,7 +147,7 @@ def main():
     formatted_response = f"""{response_text}
 
 ---
-*🤖 Response generated by Repogent AI powered by Groq*"""
+{RESPONSE_SIGNATURE}"""
     
     # Post comment
     try:
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Response Cache for Repogent
+Persists LLM responses keyed by normalized prompt text so repeated questions
+skip the Groq call entirely. Whole chat requests (triage, PR review) are cached
+by an exact hash of the request instead, so a re-run on an unchanged issue or
+diff never pays for the same completion twice.
+"""
+import os
+import sys
+import json
+import re
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Import shared constants
+from config_constants import MAX_RESPONSE_CACHE_ENTRIES
+
+__version__ = "1.0.0"
+
+DEFAULT_CACHE_DIR = '.repogent/cache/responses'
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# In-process layer over the completion cache, for repeated requests in one run
+_memory: Dict[Path, Optional[str]] = {}
+
+
+def _normalize(text: str) -> str:
+    """Collapse case and whitespace so trivially different phrasings share a key"""
+    return _WHITESPACE_RE.sub(' ', text).strip().lower()
+
+
+def make_key(key_text: str, context: str = '') -> str:
+    """
+    Build a cache key from the question text and a conversation-context fingerprint.
+    Including the context avoids returning a stale answer to a follow-up question.
+    """
+    digest = hashlib.sha256()
+    digest.update(_normalize(key_text).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(context.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def completion_key(messages: List[Dict], model: str, temperature: float) -> str:
+    """
+    Content-address a chat completion request. Unlike make_key() nothing is
+    normalized - case and whitespace are significant in a diff.
+    """
+    payload = json.dumps({'messages': messages, 'model': model, 'temperature': temperature},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _cache_path(key: str, cache_dir: Optional[str]) -> Path:
+    return Path(cache_dir or DEFAULT_CACHE_DIR) / f"{key}.json"
+
+
+def lookup(key_text: str, context: str = '', cache_dir: Optional[str] = None) -> Optional[str]:
+    """Return the cached response for this prompt, or None on a miss"""
+    return _read(_cache_path(make_key(key_text, context), cache_dir))
+
+
+def store(key_text: str, response: str, context: str = '', cache_dir: Optional[str] = None):
+    """Persist a response (best effort - cache failures never break a run)"""
+    _write(_cache_path(make_key(key_text, context), cache_dir), response)
+
+
+def lookup_completion(messages: List[Dict], model: str, temperature: float,
+                      cache_dir: Optional[str] = None) -> Optional[str]:
+    """Return the cached completion text for this exact request, or None on a miss"""
+    path = _cache_path(completion_key(messages, model, temperature), cache_dir)
+    if path not in _memory:
+        _memory[path] = _read(path)
+    return _memory[path]
+
+
+def store_completion(messages: List[Dict], model: str, temperature: float, response: str,
+                     cache_dir: Optional[str] = None):
+    """Persist the completion text for this exact request (best effort)"""
+    path = _cache_path(completion_key(messages, model, temperature), cache_dir)
+    _memory[path] = response
+    _write(path, response)
+
+
+def _read(path: Path) -> Optional[str]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        print(f"⚠️ Ignoring unreadable cache entry {path.name}: {e}", file=sys.stderr)
+        return None
+    response = entry.get('response') if isinstance(entry, dict) else None
+    return response if isinstance(response, str) and response else None
+
+
+def _write(path: Path, response: str):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # Evict oldest entries when the cache is full
+        existing = list(path.parent.glob('*.json'))
+        if len(existing) >= MAX_RESPONSE_CACHE_ENTRIES:
+            oldest = sorted(existing, key=lambda p: p.stat().st_mtime)[:len(existing) - MAX_RESPONSE_CACHE_ENTRIES + 1]
+            for old_file in oldest:
+                try:
+                    old_file.unlink()
+                except FileNotFoundError:
+                    pass
+        
+        # Atomic write to prevent corruption
+        with tempfile.NamedTemporaryFile(mode='w', encoding='utf-8',
+                                         dir=path.parent, delete=False) as tmp:
+            json.dump({'response': response}, tmp)
+            tmp_path = tmp.name
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️ Could not write response cache: {e}", file=sys.stderr)
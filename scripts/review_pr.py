@@ -16,213 +16,362 @@
 import os
 import sys
 import json
-from groq import Groq
+import re
+import asyncio
+import itertools
+
+import json_compat
+import response_cache
+from progress_log import log
 
 # Import shared constants
-from config_constants import MODEL_PR_REVIEW
-
-# Set up Groq credentials
-if not os.environ.get("GROQ_API_KEY"):
-    print("No Groq API key found", file=sys.stderr)
-    sys.exit(1)
-
-client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-
-# Use shared constant for model selection
-model_engine = os.environ.get("MODEL", MODEL_PR_REVIEW)
-commit_title = os.environ.get("COMMIT_TITLE", "")
-commit_message = os.environ.get("COMMIT_BODY", "")
-try:
-    max_length = int(os.environ.get("MAX_LENGTH", "8000"))
-    # Validate bounds - too small and prompts are truncated too much, too large and API fails
-    if max_length < 1000:
-        print(f"⚠️ MAX_LENGTH too small ({max_length}), using minimum 1000", file=sys.stderr)
-        max_length = 1000
-    elif max_length > 100000:
-        print(f"⚠️ MAX_LENGTH too large ({max_length}), using maximum 100000", file=sys.stderr)
-        max_length = 100000
-except ValueError:
-    print("⚠️ Invalid MAX_LENGTH, using default 8000", file=sys.stderr)
-    max_length = 8000
-
-# Analyze the code changes
-code = sys.stdin.read()
-
-# Check if diff is empty
-if not code or not code.strip():
-    print(json.dumps([]))
-    sys.exit(0)
-
-# Enhanced prompt for structured output
-enhanced_prompt = f"""You are an expert code reviewer. Review the following git diff and provide structured feedback.
-
-For each issue you find, provide:
-1. The file path (relative path from repository root)
-2. The line number in the NEW version of the file (look for lines starting with + in the diff)
-3. Severity level: CRITICAL (security/bugs), WARNING (performance/code smell), or SUGGESTION (style/best practices)
-4. A clear description of the issue
-5. An optional code suggestion to fix it
-
-Format your response as a JSON array like this:
-[
-  {{
-    "file": "path/to/file.py",
-    "line": 42,
-    "severity": "CRITICAL",
-    "message": "Potential SQL injection vulnerability",
-    "suggestion": "Use parameterized queries instead"
-  }}
-]
-
-IMPORTANT: The "line" field should be the actual line number in the new file (from the +line_number in @@ headers), not a relative position.
-If you cannot determine a specific line number, use 0 and the comment will be posted as a general review comment.
-
-If there are no issues, return an empty array: []
-
-Git diff to review:
-```
-{code}
+from config_constants import MODEL_PR_REVIEW, MAX_OUTPUT_TOKENS_REVIEW, pick_model
+
+SYSTEM_PROMPT = "You are an expert code reviewer. Always respond with valid JSON."
+
+# Review instructions; kept terse since every input token adds to time-to-first-token.
+# The diff goes between prefix and suffix, so the template size is known up front,
+# and everything before the diff is byte-identical across runs (provider prefix caching).
+TEMPLATE_PREFIX = """Review this git diff as an expert code reviewer.
+Return only JSON: {"reviews": [{"file": str, "line": int, "severity": "CRITICAL"|"WARNING"|"SUGGESTION", "message": str, "suggestion": str}]}
+- file: path from repository root
+- line: line number in the NEW file (from the +N in @@ headers); 0 if unknown (posted as a general comment)
+- severity: CRITICAL = security/bugs, WARNING = performance/code smell, SUGGESTION = style/best practice
+- suggestion: optional fix, "" if none
+No issues: {"reviews": []}
+
+Diff:
 ```
+"""
+TEMPLATE_SUFFIX = "\n```\n"
 
-Commit context:
-- Title: {commit_title}
-- Message: {commit_message}
+# Long PR descriptions rarely help the review; keep only their start
+MAX_COMMIT_MESSAGE_CHARS = 500
 
-Return ONLY the JSON array, no other text."""
+# Split points for whole diff units: file headers and hunk headers
+_HUNK_SPLIT_RE = re.compile(r'(?m)^(?=diff --git |@@ )')
+_FILE_SPLIT_RE = re.compile(r'(?m)^(?=diff --git )')
 
-if len(enhanced_prompt) > max_length:
-    # Truncate the code portion safely, not the JSON template
-    code_start = enhanced_prompt.find("```\n") + 4
-    code_end = enhanced_prompt.rfind("\n```")
+TRUNCATION_MARKER = "\n... (truncated - diff too large)\n"
+
+# Shards reviewed at once - parallel enough for a big PR, gentle on rate limits
+MAX_CONCURRENT_REVIEWS = 5
+
+# A shard whose review overran max_tokens is retried once with this much more room
+RETRY_TOKEN_FACTOR = 4
+
+# Upper bound on shards per PR; together with the per-shard budget this caps
+# how much diff is read and how many API calls a single review can make
+MAX_SHARDS = 20
+
+TOO_LARGE_REVIEW = [{
+    "file": "general",
+    "line": 0,
+    "severity": "WARNING",
+    "message": "Diff too large for AI review. Please review manually or split into smaller PRs.",
+    "suggestion": ""
+}]
+
+# Minimum viable code size - need at least this to make sense
+MIN_CODE_SIZE = 200
+
+# Review comment schema: field -> (type, default)
+REVIEW_FIELDS = {
+    "file": (str, "general"),
+    "line": (int, 0),
+    "severity": (str, "SUGGESTION"),
+    "message": (str, ""),
+    "suggestion": (str, ""),
+}
+
+
+def emit(reviews):
+    """
+    Write the review list to stdout as one indented JSON document in a single
+    write. UTF-8 bytes go straight to the buffer, so non-ASCII review text does
+    not depend on the runner's stdout encoding.
+    """
+    sys.stdout.flush()
+    sys.stdout.buffer.write(json_compat.dumps_bytes(reviews, indent=True) + b"\n")
+    sys.stdout.buffer.flush()
+
+
+def truncate_diff(code, available, min_size):
+    """
+    Trim a diff to at most `available` characters, dropping whole hunks so the
+    model only sees syntactically complete hunks. Falls back to cutting at the
+    last complete line when not even the first hunk fits.
+    """
+    kept = []
+    used = 0
+    for segment in _HUNK_SPLIT_RE.split(code):
+        if used + len(segment) > available:
+            break
+        kept.append(segment)
+        used += len(segment)
+    # Only a file header (or nothing) fits - keep as many complete lines as possible
+    if not any(segment.startswith('@@') for segment in kept):
+        truncated = code[:available]
+        last_newline = truncated.rfind('\n')
+        if last_newline > min_size // 2:
+            truncated = truncated[:last_newline]
+        return truncated
+    # Drop a trailing file header whose hunks did not fit
+    while kept[-1].startswith('diff --git '):
+        kept.pop()
+    return ''.join(kept).rstrip('\n')
+
+
+def shard_diff(code, available, min_size):
+    """
+    Pack whole file diffs, in order, into shards of at most `available`
+    characters so they can be reviewed in parallel. A small diff stays a
+    single shard; a file diff too large on its own is trimmed by truncate_diff().
+    """
+    shards = []
+    current = []
+    used = 0
+    for file_diff in _FILE_SPLIT_RE.split(code):
+        if not file_diff:
+            continue
+        if len(file_diff) > available:
+            file_diff = truncate_diff(file_diff, available, min_size) + TRUNCATION_MARKER
+            print(f"⚠️ File diff truncated to ~{len(file_diff)} characters", file=sys.stderr)
+        if current and used + len(file_diff) > available:
+            shards.append(''.join(current))
+            current = []
+            used = 0
+        current.append(file_diff)
+        used += len(file_diff)
+    if current:
+        shards.append(''.join(current))
+    return shards
+
+
+def error_review(message):
+    """A single general review comment reporting a failed review"""
+    return [{
+        "file": "error",
+        "line": 0,
+        "severity": "CRITICAL",
+        "message": message,
+        "suggestion": ""
+    }]
+
+
+def validate_review(item):
+    """
+    Coerce one model-produced comment to the review schema in a single pass.
+    Returns None for entries that are not objects; unknown keys are dropped.
+    """
+    if not isinstance(item, dict):
+        return None
+    review = {}
+    for field, (field_type, default) in REVIEW_FIELDS.items():
+        value = item.get(field)
+        if value is None:
+            review[field] = default
+        elif field_type is int:
+            try:
+                review[field] = max(0, int(value))
+            except (TypeError, ValueError):
+                review[field] = default
+        else:
+            review[field] = value if isinstance(value, str) else str(value)
+    return review
+
+
+def raw_output_review(review_text, problem):
+    """A single general comment carrying model output that could not be used as reviews"""
+    return [{
+        "file": "general",
+        "line": 0,
+        "severity": "WARNING",
+        "message": f"⚠️ AI Review ({problem}, showing raw output):\n\n{review_text}",
+        "suggestion": "The LLM did not return valid JSON. Please review manually."
+    }]
+
+
+def parse_reviews(content):
+    """
+    Turn a completion into a list of review dicts.
+    Returns (reviews, parsed); output that is not JSON, or JSON without a
+    review list, becomes one general comment and parsed is False.
+    """
+    review_text = content.strip()
+    try:
+        data = json_compat.loads(review_text)
+    except json.JSONDecodeError as e:
+        # Fallback: treat as plain text review but warn about parsing failure
+        print(f"⚠️ Failed to parse LLM response as JSON: {e}", file=sys.stderr)
+        return raw_output_review(review_text, "JSON parsing failed"), False
     
-    # Validate bounds FIRST before any operations
-    if code_start <= 4 or code_end <= code_start or code_end >= len(enhanced_prompt):
-        # Invalid diff structure - cannot safely truncate
-        print(f"❌ Cannot safely truncate prompt (invalid diff structure)", file=sys.stderr)
-        print(json.dumps([{
-            "file": "general",
-            "line": 0,
-            "severity": "WARNING",
-            "message": "Diff structure invalid for processing. Please review manually.",
-            "suggestion": ""
-        }]))
-        sys.exit(0)
+    # Accept the documented {"reviews": [...]} object or a bare list; any other
+    # shape (e.g. {"issues": [...]}) must not read as "no issues found"
+    reviews = data.get('reviews') if isinstance(data, dict) else data
+    if not isinstance(reviews, list):
+        print("⚠️ LLM response JSON has no 'reviews' list", file=sys.stderr)
+        return raw_output_review(review_text, "unexpected JSON shape"), False
+    return [review for review in map(validate_review, reviews) if review is not None], True
+
+
+async def review_shard(client, semaphore, kwargs):
+    """Review one shard of the diff; failures become a comment instead of failing the run"""
+    # A re-run on an identical diff (e.g. a rebase) reuses the earlier review
+    cached = response_cache.lookup_completion(kwargs['messages'], kwargs['model'], kwargs['temperature'])
+    if cached:
+        log("♻️ Using cached review")
+        return parse_reviews(cached)[0]
     
-    # Calculate how much code we can keep
-    template_size = len(enhanced_prompt) - (code_end - code_start)
-    available_for_code = max_length - template_size - 100  # 100 byte safety margin
+    async def create(request):
+        async with semaphore:
+            return await client.chat.completions.create(**request)
     
-    # Minimum viable code size - need at least this to make sense
-    MIN_CODE_SIZE = 200
+    try:
+        try:
+            response = await create(kwargs)
+            cut_off = bool(response.choices) and response.choices[0].finish_reason == 'length'
+        except Exception as e:
+            # JSON mode rejects output cut off mid-object instead of returning it
+            if 'json_validate_failed' not in str(e):
+                raise
+            cut_off = True
+        if cut_off:
+            log("✂️ Review output hit max_tokens, retrying with more room")
+            response = await create(dict(kwargs, max_tokens=kwargs['max_tokens'] * RETRY_TOKEN_FACTOR))
+    except Exception as e:
+        return error_review(f"Groq API error: {e}")
+    if not response.choices:
+        return error_review(f"No response from Groq: {response}")
+    content = response.choices[0].message.content
+    if not content:
+        return error_review("Groq API error: Empty response content from LLM")
+    
+    reviews, parsed = parse_reviews(content)
+    # Only a well-formed review list is worth replaying; a malformed answer
+    # must not be restored on every later run of the same diff
+    if parsed:
+        response_cache.store_completion(kwargs['messages'], kwargs['model'], kwargs['temperature'], content)
+    return reviews
+
+
+async def review_shards(shard_requests):
+    """Review all shards concurrently on one client and merge their comments in diff order"""
+    # Imported only once there is work to do - an empty diff never pays for it
+    from groq import AsyncGroq
     
-    if available_for_code > MIN_CODE_SIZE and len(code) > available_for_code:
-        # Truncate code intelligently - try to keep complete lines
-        truncated_code = code[:available_for_code]
-        # Find last complete line to avoid breaking mid-line
-        last_newline = truncated_code.rfind('\n')
-        if last_newline > MIN_CODE_SIZE // 2:
-            truncated_code = truncated_code[:last_newline]
-        truncated_code += "\n... (truncated - diff too large)"
-        
-        enhanced_prompt = enhanced_prompt[:code_start] + truncated_code + enhanced_prompt[code_end:]
-        print(f"⚠️ Prompt truncated to ~{len(enhanced_prompt)} characters", file=sys.stderr)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REVIEWS)
+    async with AsyncGroq(api_key=os.environ.get("GROQ_API_KEY"), max_retries=2, timeout=30) as client:
+        results = await asyncio.gather(*(review_shard(client, semaphore, kwargs) for kwargs in shard_requests))
+    return list(itertools.chain.from_iterable(results))
+
+
+def main():
+    """Review the diff on stdin and print the review comments as JSON"""
+    # Use shared constant for model selection (MODEL is the large-input default)
+    model_engine = os.environ.get("MODEL", MODEL_PR_REVIEW)
+    commit_title = os.environ.get("COMMIT_TITLE", "")
+    commit_message = os.environ.get("COMMIT_BODY", "")
+    # Omit the commit section entirely when there is no commit context
+    if commit_title or commit_message:
+        commit_section = f"\nCommit: {commit_title}\n{commit_message[:MAX_COMMIT_MESSAGE_CHARS]}"
     else:
+        commit_section = ""
+    try:
+        max_length = int(os.environ.get("MAX_LENGTH", "8000"))
+        # Validate bounds - too small and prompts are truncated too much, too large and API fails
+        if max_length < 1000:
+            print(f"⚠️ MAX_LENGTH too small ({max_length}), using minimum 1000", file=sys.stderr)
+            max_length = 1000
+        elif max_length > 100000:
+            print(f"⚠️ MAX_LENGTH too large ({max_length}), using maximum 100000", file=sys.stderr)
+            max_length = 100000
+    except ValueError:
+        print("⚠️ Invalid MAX_LENGTH, using default 8000", file=sys.stderr)
+        max_length = 8000
+
+    # Size the prompt before building it, so an oversized diff is never copied
+    # into a full-length prompt only to be cut back out of it
+    template_size = len(TEMPLATE_PREFIX) + len(TEMPLATE_SUFFIX) + len(commit_section)
+    # Truncate the code portion safely, not the JSON template
+    available_for_code = max_length - template_size - 100  # 100 byte safety margin
+
+    # Analyze the code changes - raw bytes, so a diff touching non-UTF-8 files
+    # cannot fail decoding. Read at most what MAX_SHARDS shards can hold.
+    diff_limit = MAX_SHARDS * max(available_for_code, MIN_CODE_SIZE)
+    raw_diff = sys.stdin.buffer.read(diff_limit + 1)
+    if len(raw_diff) > diff_limit:
+        print(f"❌ Diff too large to process (>{diff_limit} bytes)", file=sys.stderr)
+        emit(TOO_LARGE_REVIEW)
+        return
+    code = raw_diff.decode('utf-8', errors='replace')
+    del raw_diff
+
+    # Check if diff is empty
+    if not code or not code.strip():
+        emit([])
+        return
+
+    # Set up Groq credentials
+    if not os.environ.get("GROQ_API_KEY"):
+        print("No Groq API key found", file=sys.stderr)
+        sys.exit(1)
+
+    if available_for_code <= MIN_CODE_SIZE:
         print(f"❌ Diff too large to process (>{max_length} chars, need >{MIN_CODE_SIZE} for code)", file=sys.stderr)
-        print(json.dumps([{
-            "file": "general",
-            "line": 0,
-            "severity": "WARNING",
-            "message": "Diff too large for AI review. Please review manually or split into smaller PRs.",
-            "suggestion": ""
-        }]))
-        sys.exit(0)
-
-kwargs = {'model': model_engine}
-# Lower temperature for more consistent JSON output (configurable via env)
-try:
-    temp_str = os.environ.get("REVIEW_TEMPERATURE", "0.3")
-    if temp_str:  # Check for empty string
-        temperature = float(temp_str)
-        kwargs['temperature'] = max(0.0, min(1.0, temperature))  # Clamp to valid range
-    else:
-        kwargs['temperature'] = 0.3
-except (ValueError, TypeError):
-    kwargs['temperature'] = 0.3
-kwargs['max_tokens'] = 2048  # More tokens for detailed reviews
-kwargs['messages'] = [
-    {"role": "system",
-     "content": "You are an expert code reviewer. Always respond with valid JSON."},
-    {"role": "user", "content": enhanced_prompt},
-]
-
-try:
-    response = client.chat.completions.create(**kwargs)
-    if response.choices:
-        content = response.choices[0].message.content
-        if not content:
-            raise ValueError("Empty response content from LLM")
-        review_text = content.strip()
-        
-        # Try to parse as JSON
-        try:
-            # Extract JSON if wrapped in markdown code blocks
-            if "```json" in review_text:
-                # Find first ```json and corresponding closing ```
-                json_start = review_text.find("```json")
-                if json_start != -1:
-                    # Start after ```json and newline
-                    content_start = json_start + 7  # len("```json")
-                    # Skip any whitespace/newline after ```json
-                    while content_start < len(review_text) and review_text[content_start] in '\n\r\t ':
-                        content_start += 1
-                    # Find closing ```
-                    json_end = review_text.find("```", content_start)
-                    if json_end != -1:
-                        review_text = review_text[content_start:json_end].strip()
-            elif "```" in review_text:
-                # Generic code block
-                parts = review_text.split("```")
-                if len(parts) >= 3:
-                    review_text = parts[1].strip()
-            
-            reviews = json.loads(review_text)
-            
-            # Validate that reviews is a list
-            if not isinstance(reviews, list):
-                reviews = [{
-                    "file": "general",
-                    "line": 0,
-                    "severity": "SUGGESTION",
-                    "message": str(reviews),
-                    "suggestion": ""
-                }]
-            
-            # Output structured JSON for processing
-            print(json.dumps(reviews, indent=2))
-            
-        except json.JSONDecodeError as e:
-            # Fallback: treat as plain text review but warn about parsing failure
-            print(f"⚠️ Failed to parse LLM response as JSON: {e}", file=sys.stderr)
-            print(json.dumps([{
-                "file": "general",
-                "line": 0,
-                "severity": "WARNING",
-                "message": f"⚠️ AI Review (JSON parsing failed, showing raw output):\n\n{review_text}",
-                "suggestion": "The LLM did not return valid JSON. Please review manually."
-            }], indent=2))
-    else:
-        print(json.dumps([{
-            "file": "error",
-            "line": 0,
-            "severity": "CRITICAL",
-            "message": f"No response from Groq: {response}",
-            "suggestion": ""
-        }], indent=2))
-except Exception as e:
-    print(json.dumps([{
-        "file": "error",
-        "line": 0,
-        "severity": "CRITICAL",
-        "message": f"Groq API error: {e}",
-        "suggestion": ""
-    }], indent=2))
+        emit(TOO_LARGE_REVIEW)
+        return
+
+    shards = shard_diff(code, available_for_code, MIN_CODE_SIZE)
+    # Whole-file packing can leave shards part-empty, so check the count too
+    if len(shards) > MAX_SHARDS:
+        print(f"❌ Diff too large to process ({len(shards)} shards, max {MAX_SHARDS})", file=sys.stderr)
+        emit(TOO_LARGE_REVIEW)
+        return
+    if len(shards) > 1:
+        log(f"🔀 Reviewing {len(shards)} diff shards in parallel")
+
+    base_kwargs = {}
+    # Deterministic by default - JSON output gains nothing from sampling, and
+    # identical requests stay cacheable (configurable via env)
+    try:
+        temp_str = os.environ.get("REVIEW_TEMPERATURE", "0")
+        if temp_str:  # Check for empty string
+            temperature = float(temp_str)
+            base_kwargs['temperature'] = max(0.0, min(1.0, temperature))  # Clamp to valid range
+        else:
+            base_kwargs['temperature'] = 0.0
+    except (ValueError, TypeError):
+        base_kwargs['temperature'] = 0.0
+    # Cap output near the realistic p99 so a runaway generation cannot stall CI
+    try:
+        base_kwargs['max_tokens'] = int(os.environ.get("MAX_OUTPUT_TOKENS_REVIEW", MAX_OUTPUT_TOKENS_REVIEW))
+    except ValueError:
+        base_kwargs['max_tokens'] = MAX_OUTPUT_TOKENS_REVIEW
+    # JSON mode - the API guarantees a parseable object, no markdown fences
+    base_kwargs['response_format'] = {'type': 'json_object'}
+
+    shard_requests = []
+    for shard in shards:
+        # Enhanced prompt for structured output
+        enhanced_prompt = ''.join((TEMPLATE_PREFIX, shard, TEMPLATE_SUFFIX, commit_section))
+        shard_requests.append(dict(
+            base_kwargs,
+            # Route small shards to the fast tier when one is configured
+            model=pick_model(shard, model_engine),
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": enhanced_prompt},
+            ]
+        ))
+
+    try:
+        reviews = asyncio.run(review_shards(shard_requests))
+        # Output structured JSON for processing
+        emit(reviews)
+    except Exception as e:
+        emit(error_review(f"Groq API error: {e}"))
+
+
+if __name__ == '__main__':
+    main()
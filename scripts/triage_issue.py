@@ -6,30 +6,52 @@ Adapted from repogent-issue-manager for GitHub Actions
 import os
 import sys
 import json
-from groq import Groq
+import asyncio
+import functools
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from groq import AsyncGroq
+
+import json_compat
+import response_cache
+from progress_log import log
 
 # Import shared constants
-from config_constants import MODEL_ISSUE_TRIAGE
+from config_constants import MODEL_ISSUE_TRIAGE, MAX_OUTPUT_TOKENS_TRIAGE, pick_model
 
 # Constants
 HTTP_TIMEOUT_SECONDS = 30  # HTTP request timeout
 
-def load_config():
-    """Load label configuration"""
-    try:
-        with open('config/labels.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {"labels": ["Bug", "Enhancement", "Question"], "default_label": "Question"}
-    except (json.JSONDecodeError, UnicodeDecodeError) as e:
-        print(f"⚠️ Error loading config: {e}, using defaults", file=sys.stderr)
-        return {"labels": ["Bug", "Enhancement", "Question"], "default_label": "Question"}
+# Issues triaged at once in ISSUES_JSON batch mode
+MAX_CONCURRENT_TRIAGE = 5
 
-def classify_issue(client, title, body, allowed_labels, default_label='Question'):
-    """Use Groq LLM to classify the issue"""
-    labels_list = ", ".join(allowed_labels)
-    
-    system_prompt = f"""You are 'Repogent - Issue Manager Agent', an AI-powered GitHub issue triager using Groq's ultra-fast LLM inference.
+# The classification is a ~30 token JSON object; cap output accordingly
+try:
+    MAX_OUTPUT_TOKENS = int(os.environ.get('MAX_OUTPUT_TOKENS_TRIAGE', MAX_OUTPUT_TOKENS_TRIAGE))
+except ValueError:
+    MAX_OUTPUT_TOKENS = MAX_OUTPUT_TOKENS_TRIAGE
+
+# Markdown special characters -> backslash-escaped form (single translate pass,
+# so the backslash itself needs no special ordering)
+_MD_ESCAPE = str.maketrans({c: '\\' + c for c in '\\*_[]()`#>'})
+
+# Shared session so the label and comment calls reuse keep-alive TLS connections
+# and ride out transient GitHub errors. Each issue in flight posts its label
+# and comment concurrently, so the pool holds two connections per issue.
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    'Accept': 'application/vnd.github+json',
+    'User-Agent': 'Repogent-Bot/1.0'
+})
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=MAX_CONCURRENT_TRIAGE * 2,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+))
+
+# Classification instructions; only the label list varies between repos
+SYSTEM_PROMPT_TEMPLATE = """You are 'Repogent - Issue Manager Agent', an AI-powered GitHub issue triager using Groq's ultra-fast LLM inference.
 
 Your task is to classify GitHub issues into ONE of these categories: {labels_list}
 
@@ -44,6 +66,27 @@ IMPORTANT: Respond ONLY with valid JSON in this exact format:
 
 Do NOT include any other text, formatting, or explanation outside the JSON."""
 
+@functools.lru_cache(maxsize=1)
+def load_config():
+    """Load label configuration (read once per process; treat the result as read-only)"""
+    try:
+        with open('config/labels.json', 'rb') as f:
+            return json_compat.loads(f.read())
+    except FileNotFoundError:
+        return {"labels": ["Bug", "Enhancement", "Question"], "default_label": "Question"}
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        print(f"⚠️ Error loading config: {e}, using defaults", file=sys.stderr)
+        return {"labels": ["Bug", "Enhancement", "Question"], "default_label": "Question"}
+
+@functools.lru_cache(maxsize=8)
+def build_system_prompt(allowed_labels):
+    """Format the classification system prompt once per label set"""
+    return SYSTEM_PROMPT_TEMPLATE.format(labels_list=", ".join(allowed_labels))
+
+async def classify_issue(client, title, body, allowed_labels, default_label='Question'):
+    """Use Groq LLM to classify the issue"""
+    system_prompt = build_system_prompt(tuple(allowed_labels))
+
     user_content = f"""Issue Title: {title}
 
 Issue Body:
@@ -51,54 +94,53 @@ Issue Body:
 
 Classify this issue and respond with JSON only."""
 
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content}
+    ]
+    model = pick_model(user_content, os.getenv('GROQ_MODEL', MODEL_ISSUE_TRIAGE))
+    temperature = 0
+    
     try:
-        response = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_content}
-            ],
-            model=os.getenv('GROQ_MODEL', MODEL_ISSUE_TRIAGE),
-            max_tokens=512,
-            temperature=0
-        )
+        # A re-run on an unchanged issue reuses the earlier classification
+        cached = response_cache.lookup_completion(messages, model, temperature)
+        if cached:
+            log("♻️ Using cached classification")
+            content = cached
+        else:
+            response = await client.chat.completions.create(
+                messages=messages,
+                model=model,
+                max_tokens=MAX_OUTPUT_TOKENS,
+                temperature=temperature,
+                response_format={'type': 'json_object'}
+            )
+            if not response.choices:
+                raise ValueError("No response from LLM")
+            content = response.choices[0].message.content
         
-        if not response.choices:
-            raise ValueError("No response from LLM")
-        
-        content = response.choices[0].message.content
         if not content:
             raise ValueError("Empty response content from LLM")
         result_text = content.strip()
         
-        # Extract JSON if wrapped - safe extraction
-        if "```json" in result_text:
-            # Find first ```json and corresponding closing ```
-            json_start = result_text.find("```json")
-            if json_start != -1:
-                # Start after ```json and newline
-                content_start = json_start + 7  # len("```json")
-                # Skip any whitespace/newline after ```json
-                while content_start < len(result_text) and result_text[content_start] in '\n\r\t ':
-                    content_start += 1
-                # Find closing ```
-                json_end = result_text.find("```", content_start)
-                if json_end != -1:
-                    result_text = result_text[content_start:json_end].strip()
-        elif "```" in result_text:
-            parts = result_text.split("```")
-            if len(parts) >= 3:
-                result_text = parts[1].strip()
-        
-        result = json.loads(result_text)
-        classification = result.get('classification', '')
+        result = json_compat.loads(result_text)
+        if not isinstance(result, dict):
+            raise ValueError(f"Expected a JSON object, got {type(result).__name__}")
+        classification = result.get('classification')
+        reason = result.get('reason')
+        # Only cache completions that parsed
+        if not cached:
+            response_cache.store_completion(messages, model, temperature, content)
         
         # Validate classification - use first label as default if invalid
         if classification not in allowed_labels:
             classification = allowed_labels[0] if allowed_labels else 'Question'
+        if not isinstance(reason, str) or not reason.strip():
+            reason = 'Automatically classified by Repogent AI'
         
         return {
             "classification": classification,
-            "reason": result.get('reason', 'Automatically classified by Repogent AI')
+            "reason": reason
         }
         
     except Exception as e:
@@ -111,17 +153,11 @@ Classify this issue and respond with JSON only."""
 
 def post_comment(token, repo, issue_number, body):
     """Post a comment to the issue"""
-    import requests
-    
     url = f"https://api.github.com/repos/{repo}/issues/{issue_number}/comments"
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Accept': 'application/vnd.github+json',
-        'User-Agent': 'Repogent-Bot/1.0'
-    }
+    headers = {'Authorization': f'Bearer {token}'}
     
     try:
-        response = requests.post(url, headers=headers, json={'body': body}, timeout=HTTP_TIMEOUT_SECONDS)
+        response = _SESSION.post(url, headers=headers, json={'body': body}, timeout=HTTP_TIMEOUT_SECONDS)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.Timeout:
@@ -136,17 +172,11 @@ def post_comment(token, repo, issue_number, body):
 
 def add_labels(token, repo, issue_number, labels):
     """Add labels to the issue"""
-    import requests
-    
     url = f"https://api.github.com/repos/{repo}/issues/{issue_number}/labels"
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Accept': 'application/vnd.github+json',
-        'User-Agent': 'Repogent-Bot/1.0'
-    }
+    headers = {'Authorization': f'Bearer {token}'}
     
     try:
-        response = requests.post(url, headers=headers, json={'labels': labels}, timeout=HTTP_TIMEOUT_SECONDS)
+        response = _SESSION.post(url, headers=headers, json={'labels': labels}, timeout=HTTP_TIMEOUT_SECONDS)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.Timeout:
@@ -159,95 +189,134 @@ def add_labels(token, repo, issue_number, labels):
         print(f"Error decoding response: {e}")
         return None
 
-def main():
+async def triage_one(client, semaphore, github_token, repo, issue, allowed_labels, default_label):
+    """Classify, label and comment on one issue. Returns True on success."""
+    issue_number = issue['number']
+    issue_title = issue['title']
+    
+    async with semaphore:
+        log(f"🔍 Triaging issue #{issue_number}: {issue_title}")
+        
+        # Classify the issue
+        result = await classify_issue(client, issue_title, issue['body'], allowed_labels, default_label)
+        classification = result['classification']
+        reason = result['reason']
+        
+        log(f"🏷️ Classification: {classification}")
+        log(f"💭 Reason: {reason}")
+        
+        # Sanitize classification and reason for Markdown (escape special chars)
+        safe_classification = classification.translate(_MD_ESCAPE)
+        safe_reason = reason.translate(_MD_ESCAPE)
+        
+        # Post comment
+        comment = f"""🤖 **Beep boop! Repogent here.**
+
+I've automatically triaged this issue as: **{safe_classification}**
+
+**Reason:** {safe_reason}
+
+My fellow agents and human maintainers will take it from here. Thanks for your contribution! ⚡
+
+---
+*Powered by Groq's ultra-fast LLM inference. If this classification seems incorrect, please adjust the labels manually.*"""
+        
+        # Add labels and post the comment concurrently - neither depends on the other
+        label_result, comment_result = await asyncio.gather(
+            asyncio.to_thread(add_labels, github_token, repo, issue_number, [classification]),
+            asyncio.to_thread(post_comment, github_token, repo, issue_number, comment),
+            return_exceptions=True
+        )
+    
+    # add_labels/post_comment report request errors themselves and return None
+    if label_result is None or isinstance(label_result, Exception):
+        print(f"❌ Failed to add label on #{issue_number}: {label_result}", file=sys.stderr)
+        return False
+    log(f"✅ Added label: {classification}")
+    
+    if comment_result is None or isinstance(comment_result, Exception):
+        print(f"❌ Failed to post comment on #{issue_number}: {comment_result}", file=sys.stderr)
+        return False
+    log("💬 Posted comment")
+    
+    log(f"🎉 Successfully triaged issue #{issue_number} as {classification}")
+    return True
+
+def parse_issues_json(issues_json):
+    """
+    Parse the ISSUES_JSON batch (a list of {number, title, body} objects).
+    Entries without a positive number or a title are skipped with a warning.
+    """
+    try:
+        entries = json_compat.loads(issues_json)
+    except json.JSONDecodeError as e:
+        print(f"Invalid ISSUES_JSON: {e}", file=sys.stderr)
+        return []
+    if not isinstance(entries, list):
+        print("Invalid ISSUES_JSON: expected a list of issues", file=sys.stderr)
+        return []
+    
+    issues = []
+    for entry in entries:
+        number = entry.get('number') if isinstance(entry, dict) else None
+        if not isinstance(number, int) or isinstance(number, bool) or number <= 0 or not entry.get('title'):
+            print(f"⚠️ Skipping invalid issue entry: {entry!r:.100}", file=sys.stderr)
+            continue
+        issues.append({'number': number, 'title': entry['title'], 'body': entry.get('body') or ''})
+    return issues
+
+async def main():
     # Get environment variables
     groq_api_key = os.environ.get('GROQ_API_KEY')
     github_token = os.environ.get('GITHUB_TOKEN')
     repo = os.environ.get('GITHUB_REPOSITORY')
-    issue_number_str = os.environ.get('ISSUE_NUMBER')
-    issue_title = os.environ.get('ISSUE_TITLE')
-    issue_body = os.environ.get('ISSUE_BODY', '')
+    issues_json = os.environ.get('ISSUES_JSON')
     
-    # Validate and convert issue_number
-    try:
-        issue_number = int(issue_number_str) if issue_number_str else None
-        if not issue_number or issue_number <= 0:
-            print("Invalid issue number", file=sys.stderr)
+    if issues_json:
+        # Batch mode - backlog triage over several issues in one process
+        issues = parse_issues_json(issues_json)
+        if not issues:
+            print("No valid issues in ISSUES_JSON", file=sys.stderr)
             sys.exit(1)
-    except (ValueError, TypeError):
-        print(f"Invalid issue number format: {issue_number_str}", file=sys.stderr)
-        sys.exit(1)
+    else:
+        issue_number_str = os.environ.get('ISSUE_NUMBER')
+        issue_title = os.environ.get('ISSUE_TITLE')
+        issue_body = os.environ.get('ISSUE_BODY', '')
+        
+        # Validate and convert issue_number
+        try:
+            issue_number = int(issue_number_str) if issue_number_str else None
+            if not issue_number or issue_number <= 0:
+                print("Invalid issue number", file=sys.stderr)
+                sys.exit(1)
+        except (ValueError, TypeError):
+            print(f"Invalid issue number format: {issue_number_str}", file=sys.stderr)
+            sys.exit(1)
+        
+        if not issue_title:
+            print("Missing required environment variables", file=sys.stderr)
+            sys.exit(1)
+        issues = [{'number': issue_number, 'title': issue_title, 'body': issue_body}]
     
-    if not all([groq_api_key, github_token, repo, issue_title]):
+    if not all([groq_api_key, github_token, repo]):
         print("Missing required environment variables", file=sys.stderr)
         sys.exit(1)
     
-    # Load config and initialize Groq client
+    # Load config once for the whole batch
     config = load_config()
     allowed_labels = config.get('labels', ['Bug', 'Enhancement', 'Question'])
     default_label = config.get('default_label', 'Question')
-    client = Groq(api_key=groq_api_key)
-    
-    print(f"🔍 Triaging issue #{issue_number}: {issue_title}", file=sys.stderr)
     
-    # Classify the issue
-    result = classify_issue(client, issue_title, issue_body, allowed_labels, default_label)
-    classification = result['classification']
-    reason = result['reason']
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_TRIAGE)
+    async with AsyncGroq(api_key=groq_api_key, max_retries=2, timeout=HTTP_TIMEOUT_SECONDS) as client:
+        results = await asyncio.gather(*(
+            triage_one(client, semaphore, github_token, repo, issue, allowed_labels, default_label)
+            for issue in issues
+        ))
     
-    print(f"🏷️ Classification: {classification}", file=sys.stderr)
-    print(f"💭 Reason: {reason}", file=sys.stderr)
-    
-    # Add labels
-    try:
-        add_labels(github_token, repo, issue_number, [classification])
-        print(f"✅ Added label: {classification}", file=sys.stderr)
-    except Exception as e:
-        print(f"❌ Failed to add label: {e}", file=sys.stderr)
-        sys.exit(1)
-    
-    # Sanitize classification and reason for Markdown (escape special chars)
-    def escape_markdown(text):
-        """Escape Markdown special characters"""
-        replacements = [
-            ('\\', '\\\\'),  # Backslash first
-            ('*', '\\*'),
-            ('_', '\\_'),
-            ('[', '\\['),
-            (']', '\\]'),
-            ('(', '\\('),
-            (')', '\\)'),
-            ('`', '\\`'),
-            ('#', '\\#'),
-            ('>', '\\>'),
-        ]
-        for old, new in replacements:
-            text = text.replace(old, new)
-        return text
-    
-    safe_classification = escape_markdown(classification)
-    safe_reason = escape_markdown(reason)
-    
-    # Post comment
-    comment = f"""🤖 **Beep boop! Repogent here.**
-
-I've automatically triaged this issue as: **{safe_classification}**
-
-**Reason:** {safe_reason}
-
-My fellow agents and human maintainers will take it from here. Thanks for your contribution! ⚡
-
----
-*Powered by Groq's ultra-fast LLM inference. If this classification seems incorrect, please adjust the labels manually.*"""
-    
-    try:
-        post_comment(github_token, repo, issue_number, comment)
-        print(f"💬 Posted comment", file=sys.stderr)
-    except Exception as e:
-        print(f"❌ Failed to post comment: {e}", file=sys.stderr)
+    if not all(results):
+        print(f"❌ Failed to triage {results.count(False)} of {len(issues)} issue(s)", file=sys.stderr)
         sys.exit(1)
-    
-    print(f"🎉 Successfully triaged issue #{issue_number} as {classification}", file=sys.stderr)
 
 if __name__ == '__main__':
-    main()
+    asyncio.run(main())
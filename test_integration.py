@@ -3,17 +3,28 @@
 Integration Tests with Mocked GitHub API
 Tests agent interactions with GitHub API using mocked responses.
 """
+import io
+import os
 import sys
 import json
+import shutil
+import asyncio
+import tempfile
 import unittest
-from unittest.mock import patch, MagicMock, mock_open
-from pathlib import Path
+from unittest.mock import patch, MagicMock, AsyncMock, mock_open
 
-print("🧪 INTEGRATION TEST SUITE - Mocked GitHub API")
-print("=" * 60)
+import requests
 
-# Add scripts to path
-sys.path.insert(0, 'scripts')
+import post_review_comments
+import review_pr
+import triage_issue
+import comment_lib
+import respond_to_comment
+import cicd_agent
+import community_assistant
+import orchestrator
+import config_constants
+import response_cache
 
 
 class MockResponse:
@@ -26,6 +37,10 @@ class MockResponse:
     def json(self):
         return self.json_data
     
+    @property
+    def content(self):
+        return json.dumps(self.json_data).encode('utf-8')
+    
     @property
     def text(self):
         return self.text_data
@@ -35,13 +50,38 @@ class MockResponse:
             raise Exception(f"HTTP {self.status_code}")
 
 
+SAMPLE_DIFF = """diff --git a/test.py b/test.py
+index 123..456 789
+--- a/test.py
++++ b/test.py
+@@ -1,3 +1,5 @@
++# New line
+ def test():
+     pass
+"""
+
+SAMPLE_REVIEWS = [
+    {
+        'file': 'test.py',
+        'line': 10,
+        'severity': 'WARNING',
+        'message': 'Test warning',
+        'suggestion': 'Fix it'
+    }
+]
+
+
+def make_completion(content):
+    """Build a Groq chat completion whose first choice carries ``content``"""
+    return MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+
+
 class TestPostReviewComments(unittest.TestCase):
     """Test PR review comment posting with mocked GitHub API"""
     
-    @patch('post_review_comments.requests.post')
+    @patch.object(post_review_comments.requests, 'post')
     def test_post_review_success(self, mock_post):
         """Test successful review comment posting"""
-        from post_review_comments import post_review_comments
         
         # Mock successful API response
         mock_post.return_value = MockResponse(
@@ -49,50 +89,28 @@ class TestPostReviewComments(unittest.TestCase):
             status_code=200
         )
         
-        reviews = [
-            {
-                'file': 'test.py',
-                'line': 10,
-                'severity': 'WARNING',
-                'message': 'Test warning',
-                'suggestion': 'Fix it'
-            }
-        ]
-        
-        diff_text = """diff --git a/test.py b/test.py
-index 123..456 789
---- a/test.py
-+++ b/test.py
-@@ -1,3 +1,5 @@
-+# New line
- def test():
-     pass
-"""
-        
-        result = post_review_comments(
+        result = post_review_comments.post_review_comments(
             'fake-token',
             'owner/repo',
             1,
             'abc123',
-            reviews,
-            diff_text
+            SAMPLE_REVIEWS,
+            SAMPLE_DIFF
         )
         
         self.assertTrue(result)
         self.assertTrue(mock_post.called)
     
-    @patch('post_review_comments.requests.post')
+    @patch.object(post_review_comments.requests, 'post')
     def test_post_review_api_error(self, mock_post):
         """Test handling of GitHub API errors"""
-        from post_review_comments import post_review_comments
-        import requests
         
         # Mock API error by raising exception
         mock_post.side_effect = requests.exceptions.RequestException("API Error")
         
         reviews = [{'file': 'test.py', 'line': 10, 'severity': 'INFO', 'message': 'Test'}]
         
-        result = post_review_comments(
+        result = post_review_comments.post_review_comments(
             'fake-token',
             'owner/repo',
             1,
@@ -102,45 +120,475 @@ index 123..456 789
         )
         
         self.assertFalse(result)
+    
+    @patch.object(post_review_comments.requests, 'post')
+    def test_post_review_deduplicates(self, mock_post):
+        """Test duplicate reviews are posted only once"""
+        
+        mock_post.return_value = MockResponse(status_code=200)
+        
+        review = {'file': 'test.py', 'line': 1, 'severity': 'WARNING', 'message': 'Same finding'}
+        diff_text = """diff --git a/test.py b/test.py
+--- a/test.py
++++ b/test.py
+@@ -0,0 +1 @@
++x = 1
+"""
+        
+        result = post_review_comments.post_review_comments('fake-token', 'owner/repo', 1, 'abc123',
+                                                           [review, dict(review)], diff_text)
+        
+        self.assertTrue(result)
+        review_data = mock_post.call_args.kwargs['json']
+        self.assertEqual(len(review_data['comments']), 1)
+    
+    def test_parse_diff_line_mapping(self):
+        """Test diff parsing into added/context line sets"""
+        
+        diff_text = """diff --git a/test.py b/test.py
+--- a/test.py
++++ b/test.py
+@@ -1,3 +1,4 @@
++# New line
+ def test():
+-    return 1
++    pass
+ # end
+"""
+        file_lines = post_review_comments.parse_diff_for_line_mapping(diff_text)
+        
+        self.assertEqual(file_lines['test.py']['added'], {1, 3})
+        self.assertEqual(file_lines['test.py']['all'], {1, 2, 3, 4})
+        # Raw bytes (as read from diff.txt) parse identically
+        self.assertEqual(post_review_comments.parse_diff_for_line_mapping(diff_text.encode('utf-8')), file_lines)
+    
+    def test_nearest_line(self):
+        """Test snapping to the closest commentable line, lower line on ties"""
+        lines = [3, 7, 20]
+        
+        self.assertEqual(post_review_comments._nearest_line(lines, 7), 7)
+        self.assertEqual(post_review_comments._nearest_line(lines, 5), 3)
+        self.assertEqual(post_review_comments._nearest_line(lines, 6), 7)
+        self.assertEqual(post_review_comments._nearest_line(lines, 1), 3)
+        self.assertEqual(post_review_comments._nearest_line(lines, 99), 20)
+        self.assertEqual(post_review_comments._nearest_line([4], 9), 4)
+    
+    def test_build_review_body(self):
+        """Test general comment body assembly"""
+        
+        body = post_review_comments.build_review_body('# Title', ['first', 'second'])
+        self.assertEqual(body, '# Title\n\nfirst\n\n---\n\nsecond')
+        self.assertEqual(post_review_comments.build_review_body('# Title', []), '# Title\n\n')
+
+
+class TestReviewPR(unittest.TestCase):
+    """Test diff sizing and review parsing in review_pr"""
+    
+    @staticmethod
+    def file_diff(name, hunks):
+        """A one-file diff with one three-line hunk per entry in hunks"""
+        diff = f"diff --git a/{name} b/{name}\n--- a/{name}\n+++ b/{name}\n"
+        for start, text in hunks:
+            diff += f"@@ -{start},2 +{start},3 @@\n {text}\n+{text} added\n {text} end\n"
+        return diff
+    
+    def test_truncate_diff_keeps_whole_hunks(self):
+        """Test truncation drops the hunk that does not fit instead of cutting it"""
+        diff = self.file_diff('a.py', [(1, 'first'), (20, 'second')])
+        cut = diff.index('@@ -20') + 10
+        
+        truncated = review_pr.truncate_diff(diff, cut, 10)
+        
+        self.assertEqual(truncated, diff[:diff.index('@@ -20')].rstrip('\n'))
+        self.assertNotIn('second', truncated)
+        # Without room for a single hunk, cut at the last complete line
+        self.assertTrue(diff.startswith(review_pr.truncate_diff(diff, 50, 10) + '\n'))
+    
+    def test_shard_diff_packs_files_in_order(self):
+        """Test whole files are packed into shards without reordering"""
+        files = [self.file_diff(f'f{i}.py', [(1, f'line{i}')]) for i in range(3)]
+        
+        shards = review_pr.shard_diff(''.join(files), len(files[0]) * 2 + 5, 10)
+        
+        self.assertEqual(shards, [files[0] + files[1], files[2]])
+        self.assertEqual(review_pr.shard_diff(''.join(files), 10 ** 6, 10), [''.join(files)])
+    
+    def test_shard_diff_truncates_oversized_file(self):
+        """Test a single file larger than a shard is trimmed and marked"""
+        big = self.file_diff('big.py', [(i * 10, f'hunk{i}') for i in range(1, 20)])
+        small = self.file_diff('small.py', [(1, 'tiny')])
+        
+        shards = review_pr.shard_diff(big + small, 300, 10)
+        
+        self.assertTrue(shards[0].endswith(review_pr.TRUNCATION_MARKER))
+        self.assertLessEqual(len(shards[0]), 300 + len(review_pr.TRUNCATION_MARKER))
+        self.assertEqual(shards[-1], small)
+    
+    def test_validate_review_coerces_fields(self):
+        """Test the schema pass coerces line numbers and fills defaults"""
+        self.assertEqual(review_pr.validate_review({'file': 'a.py', 'line': '12', 'message': 'x'})['line'], 12)
+        self.assertEqual(review_pr.validate_review({'line': -3})['line'], 0)
+        self.assertEqual(review_pr.validate_review({'line': 'n/a'})['line'], 0)
+        self.assertEqual(review_pr.validate_review({'line': 4.7, 'extra': 1}),
+                         {'file': 'general', 'line': 4, 'severity': 'SUGGESTION', 'message': '', 'suggestion': ''})
+        self.assertIsNone(review_pr.validate_review('not a review'))
+    
+    def test_parse_reviews_payload_shapes(self):
+        """Test both the documented object and a bare list are accepted"""
+        comment = {'file': 'a.py', 'line': 3, 'severity': 'WARNING', 'message': 'm', 'suggestion': ''}
+        
+        self.assertEqual(review_pr.parse_reviews(json.dumps({'reviews': [comment]})), ([comment], True))
+        self.assertEqual(review_pr.parse_reviews(json.dumps([comment, 'junk'])), ([comment], True))
+        self.assertEqual(review_pr.parse_reviews('{"reviews": []}'), ([], True))
+        
+        reviews, parsed = review_pr.parse_reviews('not json')
+        self.assertFalse(parsed)
+        self.assertIn('not json', reviews[0]['message'])
+    
+    def test_parse_reviews_rejects_unexpected_shape(self):
+        """Test JSON without a reviews list is surfaced, not read as 'no issues'"""
+        for content in ['{"review": [{"file": "a.py", "message": "m"}]}', '{"reviews": "none"}', '"ok"']:
+            reviews, parsed = review_pr.parse_reviews(content)
+            self.assertFalse(parsed, content)
+            self.assertEqual(len(reviews), 1)
+            self.assertIn(content, reviews[0]['message'])
+    
+    def test_emit_writes_utf8_regardless_of_stdout_encoding(self):
+        """Test non-ASCII reviews survive a runner whose stdout is not UTF-8"""
+        raw = io.BytesIO()
+        stdout = io.TextIOWrapper(raw, encoding='cp1252')
+        reviews = [{'file': 'a.py', 'line': 1, 'severity': 'WARNING', 'message': '⚠️ naïve “quote”', 'suggestion': ''}]
+        
+        with patch.object(sys, 'stdout', stdout):
+            review_pr.emit(reviews)
+        
+        self.assertEqual(json.loads(raw.getvalue().decode('utf-8')), reviews)
+    
+    def test_review_shard_retries_cut_off_output(self):
+        """Test output that overran max_tokens is retried once with more room"""
+        comment = {'file': 'a.py', 'line': 3, 'severity': 'WARNING', 'message': 'm', 'suggestion': ''}
+        cut_off = make_completion('{"reviews": [{"file": "a.py"')
+        cut_off.choices[0].finish_reason = 'length'
+        json_failure = Exception("Error code: 400 - {'error': {'code': 'json_validate_failed'}}")
+        kwargs = {'model': 'm', 'temperature': 0.0, 'max_tokens': 100,
+                  'messages': [{'role': 'user', 'content': 'diff'}]}
+        
+        for first in (cut_off, json_failure):
+            mock_client = MagicMock()
+            mock_client.chat.completions.create = AsyncMock(side_effect=[
+                first, make_completion(json.dumps({'reviews': [comment]}))])
+            with tempfile.TemporaryDirectory() as tmp_dir, \
+                    patch.object(response_cache, 'DEFAULT_CACHE_DIR', tmp_dir):
+                reviews = asyncio.run(review_pr.review_shard(mock_client, asyncio.Semaphore(1), kwargs))
+            
+            self.assertEqual(reviews, [comment])
+            self.assertEqual([c.kwargs['max_tokens'] for c in mock_client.chat.completions.create.call_args_list],
+                             [100, 100 * review_pr.RETRY_TOKEN_FACTOR])
+    
+    def test_review_shard_caches_only_valid_reviews(self):
+        """Test a wrong-shaped answer is not cached and the next run asks again"""
+        comment = {'file': 'a.py', 'line': 3, 'severity': 'WARNING', 'message': 'm', 'suggestion': ''}
+        mock_client = MagicMock()
+        mock_client.chat.completions.create = AsyncMock(side_effect=[
+            make_completion(json.dumps({'review': [comment]})),
+            make_completion(json.dumps({'reviews': [comment]})),
+        ])
+        kwargs = {'model': 'm', 'temperature': 0.0, 'messages': [{'role': 'user', 'content': 'diff'}]}
+        
+        async def review_three_times():
+            semaphore = asyncio.Semaphore(1)
+            return [await review_pr.review_shard(mock_client, semaphore, kwargs) for _ in range(3)]
+        
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                patch.object(response_cache, 'DEFAULT_CACHE_DIR', tmp_dir):
+            malformed, fresh, cached = asyncio.run(review_three_times())
+        
+        self.assertIn('unexpected JSON shape', malformed[0]['message'])
+        self.assertEqual(fresh, [comment])
+        self.assertEqual(cached, [comment])
+        self.assertEqual(mock_client.chat.completions.create.call_count, 2)
 
 
 class TestTriageIssue(unittest.TestCase):
     """Test issue triage with mocked GitHub API"""
     
-    @patch('triage_issue.Groq')
-    def test_triage_classification(self, mock_groq):
+    def test_triage_classification(self):
         """Test issue classification"""
-        from triage_issue import classify_issue
         
         # Mock Groq response
         mock_client = MagicMock()
-        mock_groq.return_value = mock_client
+        mock_client.chat.completions.create = AsyncMock(return_value=make_completion(
+            '{"classification": "Bug", "reason": "Reports an error"}'))
         
-        mock_response = MagicMock()
-        mock_choice = MagicMock()
-        mock_choice.message.content = '{"classification": "Bug", "reason": "Reports an error"}'
-        mock_response.choices = [mock_choice]
-        mock_client.chat.completions.create.return_value = mock_response
-        
-        # Test classification
-        result = classify_issue(
-            mock_client,
-            "App crashes on startup",
-            "The application throws an error",
-            ['Bug', 'Enhancement', 'Question']
-        )
+        # Test classification; the same issue again is served from the cache
+        issue = ("App crashes on startup", "The application throws an error")
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                patch.object(response_cache, 'DEFAULT_CACHE_DIR', tmp_dir):
+            result = asyncio.run(triage_issue.classify_issue(mock_client, *issue, ['Bug', 'Enhancement', 'Question']))
+            cached = asyncio.run(triage_issue.classify_issue(mock_client, *issue, ['Bug', 'Enhancement', 'Question']))
         
         self.assertEqual(result['classification'], 'Bug')
         self.assertIn('error', result['reason'].lower())
+        self.assertEqual(cached, result)
+        self.assertEqual(mock_client.chat.completions.create.call_count, 1)
+        self.assertEqual(mock_client.chat.completions.create.call_args.kwargs['response_format'],
+                         {'type': 'json_object'})
+
+    
+    def test_triage_batch(self):
+        """Test ISSUES_JSON triages every valid issue in one run"""
+        
+        issues = json.dumps([
+            {'number': 1, 'title': 'Crash on start', 'body': 'Traceback...'},
+            {'number': 2, 'title': 'Add dark mode'},
+            {'number': 0, 'title': 'Invalid number'},
+        ])
+        env = {'GROQ_API_KEY': 'k', 'GITHUB_TOKEN': 't', 'GITHUB_REPOSITORY': 'owner/repo', 'ISSUES_JSON': issues}
+        classify = AsyncMock(return_value={'classification': 'Bug', 'reason': 'Reports an error'})
+        
+        with patch.dict(os.environ, env, clear=True), \
+                patch.object(triage_issue, 'AsyncGroq'), \
+                patch.object(triage_issue, 'classify_issue', classify), \
+                patch.object(triage_issue, 'add_labels') as mock_labels, \
+                patch.object(triage_issue, 'post_comment') as mock_comment:
+            asyncio.run(triage_issue.main())
+        
+        self.assertEqual(classify.call_count, 2)
+        self.assertEqual(sorted(c.args[2] for c in mock_labels.call_args_list), [1, 2])
+        self.assertEqual(mock_comment.call_count, 2)
+    
+    def test_triage_one_reports_failed_label(self):
+        """Test a label request that failed (None result) fails the issue"""
+        issue = {'number': 3, 'title': 'Crash', 'body': ''}
+        classify = AsyncMock(return_value={'classification': 'Bug', 'reason': 'Reports an error'})
+        
+        async def triage():
+            return await triage_issue.triage_one(MagicMock(), asyncio.Semaphore(1), 't', 'owner/repo',
+                                                 issue, ['Bug'], 'Bug')
+        
+        with patch.object(triage_issue, 'classify_issue', classify), \
+                patch.object(triage_issue, 'add_labels', return_value=None), \
+                patch.object(triage_issue, 'post_comment', return_value={'id': 1}):
+            self.assertFalse(asyncio.run(triage()))
+        with patch.object(triage_issue, 'classify_issue', classify), \
+                patch.object(triage_issue, 'add_labels', return_value=[{'name': 'Bug'}]), \
+                patch.object(triage_issue, 'post_comment', return_value=None):
+            self.assertFalse(asyncio.run(triage()))
+
+
+class TestCommentLib(unittest.TestCase):
+    """Test shared comment helpers with mocked GitHub API"""
+    
+    @patch.object(comment_lib._SESSION, 'post')
+    def test_fetch_issue_with_comments(self, mock_post):
+        """Test GraphQL issue fetch flags bot comments"""
+        
+        mock_post.return_value = MockResponse(
+            json_data={'data': {'repository': {'issue': {
+                'title': 'Crash on start',
+                'body': 'It crashes',
+                'comments': {'nodes': [
+                    {'databaseId': 101, 'author': {'login': 'alice', '__typename': 'User'}, 'body': 'Same here', 'createdAt': 't1'},
+                    {'author': {'login': 'helper', '__typename': 'Bot'}, 'body': 'Automated', 'createdAt': 't2'},
+                    {'author': None, 'body': 'Ghost comment', 'createdAt': 't3'},
+                ]}
+            }}}},
+            status_code=200
+        )
+        
+        issue = comment_lib.fetch_issue_with_comments('fake-token', 'owner/repo', 7)
+        
+        self.assertEqual(issue['title'], 'Crash on start')
+        self.assertEqual([c['is_bot'] for c in issue['conversation']], [False, True, False])
+        self.assertEqual(issue['conversation'][0]['id'], 101)
+        self.assertEqual(issue['conversation'][2]['author'], 'unknown')
+        variables = mock_post.call_args.kwargs['json']['variables']
+        self.assertEqual((variables['owner'], variables['name'], variables['number']), ('owner', 'repo', 7))
+    
+    @patch.object(comment_lib._SESSION, 'get')
+    def test_get_issue_comments_etag_cache(self, mock_get):
+        """Test a 304 reuses the conversation cached from the previous 200"""
+        
+        first = MockResponse(
+            json_data=[{'user': {'login': 'alice', 'type': 'User'}, 'body': 'Hi', 'created_at': 't1'}],
+            status_code=200
+        )
+        first.headers = {'ETag': '"abc"'}
+        not_modified = MockResponse(status_code=304)
+        not_modified.headers = {}
+        mock_get.side_effect = [first, not_modified]
+        
+        with tempfile.TemporaryDirectory() as tmp_dir, patch.object(comment_lib, 'ETAG_CACHE_DIR', tmp_dir):
+            fresh = comment_lib.get_issue_comments('fake-token', 'owner/repo', 7)
+            cached = comment_lib.get_issue_comments('fake-token', 'owner/repo', 7)
+        
+        self.assertEqual(cached, fresh)
+        self.assertEqual(mock_get.call_args.kwargs['headers']['If-None-Match'], '"abc"')
+    
+    def test_generate_response_streams(self):
+        """Test streamed deltas are joined, the stream is closed and the answer cached"""
+        
+        chunks = []
+        for text in ['Try ', 'restarting', None]:
+            chunk = MagicMock()
+            chunk.choices[0].delta.content = text
+            chunks.append(chunk)
+        stream = MagicMock()
+        stream.__iter__.return_value = iter(chunks)
+        mock_client = MagicMock()
+        mock_client.chat.completions.create.return_value = stream
+        
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                patch.object(response_cache, 'DEFAULT_CACHE_DIR', tmp_dir):
+            answer = comment_lib.generate_response(mock_client, 'Title', 'Body', [{'body': 'How do I fix it?'}], [])
+            # Same question in the same conversation state is served from cache
+            cached = comment_lib.generate_response(mock_client, 'Title', 'Body', [{'body': 'how do I  fix it?'}], [])
+        
+        self.assertEqual(answer, 'Try restarting')
+        self.assertTrue(stream.close.called)
+        self.assertEqual(cached, answer)
+        self.assertEqual(mock_client.chat.completions.create.call_count, 1)
+    
+    def test_build_response_messages_stable_prefix(self):
+        """Test only the trailing message changes between comments on one issue"""
+        
+        history = [{'author': 'alice', 'body': 'Same here'}]
+        first = comment_lib.build_response_messages('Title', 'Body', [{'body': 'First question?'}], history)
+        second = comment_lib.build_response_messages('Title', 'Body', [{'body': 'Second question?'}], history)
+        
+        self.assertEqual(first[:-1], second[:-1])
+        self.assertIn('Second question?', second[-1]['content'])
+        self.assertEqual(len(comment_lib.build_response_messages('Title', 'Body', [{'body': 'Q?'}], [])), 3)
+    
+    def test_split_pending_batches_since_last_bot(self):
+        """Test comments after the last bot reply are answered together"""
+        
+        conversation = [
+            {'author': 'alice', 'body': 'Is this fixed in 2.0?', 'is_bot': False},
+            {'author': 'github-actions[bot]', 'body': f'Yes, see the changelog.\n\n---\n{comment_lib.RESPONSE_SIGNATURE}', 'is_bot': True},
+            {'author': 'bob', 'body': 'Still failing for me on macOS', 'is_bot': False},
+            {'author': 'carol', 'body': '+1', 'is_bot': False},
+            {'author': 'dave', 'body': 'Same on Linux with Python 3.12', 'is_bot': False},
+        ]
+        
+        history, pending = comment_lib.split_pending(conversation)
+        
+        self.assertEqual([c['author'] for c in history], ['alice'])
+        self.assertEqual([c['author'] for c in pending], ['bob', 'dave'])
+        latest = comment_lib.build_response_messages('Title', 'Body', pending, history)[-1]['content']
+        self.assertTrue(latest.startswith('Latest Comments:'))
+        self.assertIn('dave: Same on Linux', latest)
+    
+    def test_split_pending_skips_excluded_and_stale(self):
+        """Test workflow-excluded and long-unanswered comments are not batched"""
+        
+        conversation = [
+            {'author': 'alice', 'body': 'Old question from last week', 'created_at': '2025-01-01T10:00:00Z', 'is_bot': False},
+            {'author': 'bob', 'body': '@Repogent where is the parser?', 'created_at': '2025-01-08T10:00:00Z', 'is_bot': False},
+            {'author': 'carol', 'body': 'Noting this for later [skip-triage]', 'created_at': '2025-01-08T10:01:00Z', 'is_bot': False},
+            {'author': 'dave', 'body': 'Still failing on the latest release', 'created_at': '2025-01-08T10:02:00Z', 'is_bot': False},
+        ]
+        
+        history, pending = comment_lib.split_pending(conversation)
+        
+        self.assertEqual([c['author'] for c in pending], ['dave'])
+        self.assertEqual([c['author'] for c in history], ['alice'])
+    
+    def test_respond_matches_triggering_comment_by_id(self):
+        """Test a repeated comment body is answered; only the answered id is skipped"""
+        question = 'Is there any update on this?'
+        issue = {'title': 'Title', 'body': 'Body', 'conversation': [
+            {'id': 1, 'author': 'alice', 'body': question, 'is_bot': False},
+            {'id': 2, 'author': 'github-actions[bot]', 'body': f'Not yet.\n\n---\n{comment_lib.RESPONSE_SIGNATURE}', 'is_bot': True},
+            {'id': 3, 'author': 'bob', 'body': question, 'is_bot': False},
+        ]}
+        env = {'GROQ_API_KEY': 'k', 'GITHUB_TOKEN': 't', 'GITHUB_REPOSITORY': 'owner/repo', 'ISSUE_NUMBER': '7',
+               'COMMENT_BODY': question, 'COMMENT_AUTHOR': 'bob', 'COMMENT_DEBOUNCE_SECONDS': '0'}
+        
+        with patch.object(respond_to_comment, 'Groq'), \
+                patch.object(respond_to_comment, 'fetch_issue_with_comments', return_value=issue), \
+                patch.object(respond_to_comment, 'generate_response', return_value='Working on it') as mock_generate, \
+                patch.object(respond_to_comment, 'post_comment') as mock_post:
+            with patch.dict(os.environ, dict(env, COMMENT_ID='3'), clear=True):
+                respond_to_comment.main()
+            with patch.dict(os.environ, dict(env, COMMENT_ID='1', COMMENT_AUTHOR='alice'), clear=True), \
+                    self.assertRaises(SystemExit) as exit_info:
+                respond_to_comment.main()
+        
+        self.assertEqual(exit_info.exception.code, 0)
+        self.assertEqual(mock_generate.call_count, 1)
+        self.assertEqual([c['id'] for c in mock_generate.call_args.args[3]], [3])
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertIn(comment_lib.RESPONSE_SIGNATURE, mock_post.call_args.args[3])
+    
+    def test_respond_ignores_other_bot_comments(self):
+        """Test a triage comment landing after the question does not count as the answer"""
+        issue = {'title': 'Title', 'body': 'Body', 'conversation': [
+            {'id': 1, 'author': 'alice', 'body': 'Which versions are affected?', 'is_bot': False},
+            {'id': 2, 'author': 'github-actions[bot]', 'body': "🤖 **Beep boop! Repogent here.** I've triaged this issue.",
+             'is_bot': True},
+            {'id': 3, 'author': 'dependabot[bot]', 'body': 'Bumps requests from 2.31 to 2.32.', 'is_bot': True},
+        ]}
+        env = {'GROQ_API_KEY': 'k', 'GITHUB_TOKEN': 't', 'GITHUB_REPOSITORY': 'owner/repo', 'ISSUE_NUMBER': '7',
+               'COMMENT_BODY': 'Which versions are affected?', 'COMMENT_AUTHOR': 'alice', 'COMMENT_ID': '1',
+               'COMMENT_DEBOUNCE_SECONDS': '0'}
+        
+        with patch.dict(os.environ, env, clear=True), \
+                patch.object(respond_to_comment, 'Groq'), \
+                patch.object(respond_to_comment, 'fetch_issue_with_comments', return_value=issue), \
+                patch.object(respond_to_comment, 'generate_response', return_value='All 2.x') as mock_generate, \
+                patch.object(respond_to_comment, 'post_comment'):
+            respond_to_comment.main()
+        
+        self.assertEqual([c['id'] for c in mock_generate.call_args.args[3]], [1])
+    
+    def test_respond_rest_fallback_answers_only_trigger(self):
+        """Test a trigger missing from the REST first page is answered alone"""
+        # Page 1 of a long thread: oldest comments, ending in two that were
+        # answered on a later page the fallback never sees
+        page = [{'id': i, 'author': f'user{i}', 'body': f'Old question number {i}?',
+                 'created_at': f'2024-01-01T10:{i:02d}:00Z', 'is_bot': False} for i in range(28)]
+        page[27] = {'id': 27, 'author': 'github-actions[bot]', 'body': f'Answered.\n\n---\n{comment_lib.RESPONSE_SIGNATURE}',
+                    'created_at': '2024-01-01T10:27:00Z', 'is_bot': True}
+        page += [{'id': i, 'author': f'user{i}', 'body': f'Old question number {i}?',
+                  'created_at': f'2024-01-01T10:{i:02d}:00Z', 'is_bot': False} for i in (28, 29)]
+        env = {'GROQ_API_KEY': 'k', 'GITHUB_TOKEN': 't', 'GITHUB_REPOSITORY': 'owner/repo', 'ISSUE_NUMBER': '7',
+               'COMMENT_BODY': 'Does this still fail on 3.0?', 'COMMENT_AUTHOR': 'erin', 'COMMENT_ID': '500',
+               'COMMENT_DEBOUNCE_SECONDS': '0'}
+        
+        with patch.dict(os.environ, env, clear=True), \
+                patch.object(respond_to_comment, 'Groq'), \
+                patch.object(respond_to_comment, 'fetch_issue_with_comments', return_value=None), \
+                patch.object(respond_to_comment, 'get_issue_comments', return_value=page), \
+                patch.object(respond_to_comment, 'generate_response', return_value='Yes') as mock_generate, \
+                patch.object(respond_to_comment, 'post_comment'):
+            respond_to_comment.main()
+        
+        pending = mock_generate.call_args.args[3]
+        self.assertEqual([c['id'] for c in pending], [500])
+    
+    def test_is_trivial(self):
+        """Test non-actionable comments are detected"""
+        
+        for body in ['+1', 'thanks!', '  👍🎉  ', '!!!!!!!!!!!!', '/label bug please']:
+            self.assertTrue(comment_lib.is_trivial(body), body)
+        self.assertFalse(comment_lib.is_trivial('Why does the build fail on Windows?'))
+    
+    @patch.object(comment_lib._SESSION, 'post')
+    def test_fetch_issue_graphql_error(self, mock_post):
+        """Test GraphQL errors fall back to None"""
+        
+        mock_post.return_value = MockResponse(json_data={'errors': [{'message': 'Bad'}]})
+        
+        self.assertIsNone(comment_lib.fetch_issue_with_comments('fake-token', 'owner/repo', 7))
 
 
 class TestCICDAgent(unittest.TestCase):
     """Test CI/CD agent with mocked GitHub API"""
     
-    @patch('cicd_agent.requests.get')
+    @patch.object(cicd_agent.requests, 'get')
     def test_get_workflow_run(self, mock_get):
         """Test fetching workflow run details"""
-        from cicd_agent import CICDAgent
         
         # Mock workflow run response
         mock_get.return_value = MockResponse(
@@ -154,7 +602,7 @@ class TestCICDAgent(unittest.TestCase):
             status_code=200
         )
         
-        agent = CICDAgent()
+        agent = cicd_agent.CICDAgent()
         agent.github_token = 'fake-token'
         agent.repo = 'owner/repo'
         
@@ -166,9 +614,8 @@ class TestCICDAgent(unittest.TestCase):
     
     def test_build_log_analyzer(self):
         """Test build log analysis without external dependencies"""
-        from cicd_agent import BuildLogAnalyzer
         
-        analyzer = BuildLogAnalyzer()
+        analyzer = cicd_agent.BuildLogAnalyzer()
         
         # Test test failure detection
         logs = """
@@ -189,63 +636,49 @@ class TestCICDAgent(unittest.TestCase):
 class TestCommunityAssistant(unittest.TestCase):
     """Test community assistant with mocked components"""
     
+    # Mock indexed files, shared read-only by every test in the class
+    INDEXED_FILES = {
+        'test.py': {
+            'content': 'def hello():\n    print("Hello")\n',
+            'lines': ['def hello():', '    print("Hello")', ''],
+            'size': 100
+        }
+    }
+    
     def test_search_codebase(self):
         """Test codebase search functionality"""
-        from community_assistant import search_codebase
-        
-        # Mock indexed files
-        indexed_files = {
-            'test.py': {
-                'content': 'def hello():\n    print("Hello")\n',
-                'lines': ['def hello():', '    print("Hello")', ''],
-                'size': 100
-            }
-        }
         
-        results = search_codebase(indexed_files, 'hello function', max_results=5)
+        results = community_assistant.search_codebase(self.INDEXED_FILES, 'hello function', max_results=5)
         
         self.assertTrue(len(results) > 0)
         self.assertEqual(results[0]['file'], 'test.py')
     
     def test_generate_permalink(self):
         """Test GitHub permalink generation"""
-        from community_assistant import generate_permalink
         
-        url = generate_permalink('owner', 'repo', 'main', 'src/test.py', 10, 15)
+        url = community_assistant.generate_permalink('owner', 'repo', 'main', 'src/test.py', 10, 15)
         
         self.assertIn('github.com', url)
         self.assertIn('owner/repo', url)
         self.assertIn('src/test.py', url)
         self.assertIn('L10-L15', url)
     
-    @patch('community_assistant.requests.post')
-    @patch('community_assistant.Groq')
+    @patch.object(comment_lib._SESSION, 'post')
+    @patch.object(community_assistant, 'Groq')
     def test_answer_question(self, mock_groq, mock_post):
         """Test question answering with mocked LLM"""
-        from community_assistant import answer_question
         
         # Mock Groq response
         mock_client = MagicMock()
         mock_groq.return_value = mock_client
         
-        mock_response = MagicMock()
-        mock_choice = MagicMock()
-        mock_choice.message.content = 'The hello function is defined in test.py'
-        mock_response.choices = [mock_choice]
-        mock_client.chat.completions.create.return_value = mock_response
-        
-        indexed_files = {
-            'test.py': {
-                'content': 'def hello(): pass',
-                'lines': ['def hello(): pass'],
-                'size': 20
-            }
-        }
+        mock_client.chat.completions.create.return_value = make_completion(
+            'The hello function is defined in test.py')
         
-        answer = answer_question(
+        answer = community_assistant.answer_question(
             mock_client,
             'How does hello work?',
-            indexed_files,
+            self.INDEXED_FILES,
             'owner',
             'repo',
             'main'
@@ -258,11 +691,17 @@ class TestCommunityAssistant(unittest.TestCase):
 class TestOrchestrator(unittest.TestCase):
     """Test orchestrator functionality"""
     
+    def setUp(self):
+        # Orchestrator stores context and queue files under the working directory
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.tmp_dir)
+    
     def test_event_routing(self):
         """Test event routing logic"""
-        from orchestrator import Orchestrator
         
-        orch = Orchestrator()
+        orch = orchestrator.Orchestrator()
         
         # Test various event types
         self.assertEqual(orch.route_event('pull_request', {}), 'pr_reviewer')
@@ -279,36 +718,29 @@ class TestOrchestrator(unittest.TestCase):
     
     def test_message_validation(self):
         """Test message validation and size limits"""
-        from orchestrator import Message
         
         # Valid message
-        msg = Message('agent1', 'agent2', 'test', {'key': 'value'})
+        msg = orchestrator.Message('agent1', 'agent2', 'test', {'key': 'value'})
         self.assertIsNotNone(msg.id)
         self.assertEqual(msg.sender, 'agent1')
         
         # Invalid sender type
         with self.assertRaises(ValueError):
-            Message(123, 'agent2', 'test', {})
+            orchestrator.Message(123, 'agent2', 'test', {})
         
         # Invalid payload type
         with self.assertRaises(ValueError):
-            Message('agent1', 'agent2', 'test', 'not a dict')
+            orchestrator.Message('agent1', 'agent2', 'test', 'not a dict')
     
     def test_context_path_sanitization(self):
         """Test context store path traversal prevention"""
-        from orchestrator import ContextStore
         
-        store = ContextStore('.test_context')
+        store = orchestrator.ContextStore(os.path.join(self.tmp_dir, 'context'))
         
         # Test sanitization removes dangerous characters
         safe_id = store._sanitize_context_id('../../../etc/passwd')
         self.assertNotIn('..', safe_id)
         self.assertNotIn('/', safe_id)
-        
-        # Cleanup
-        import shutil
-        if Path('.test_context').exists():
-            shutil.rmtree('.test_context')
 
 
 class TestConfigConstants(unittest.TestCase):
@@ -316,57 +748,36 @@ class TestConfigConstants(unittest.TestCase):
     
     def test_model_selection(self):
         """Test model selection helper"""
-        from config_constants import get_model_for_task
         
         # All tasks now use llama-3.3-70b-versatile (3.1-8b-instant decommissioned)
-        self.assertEqual(get_model_for_task('pr_review'), 'llama-3.3-70b-versatile')
-        self.assertEqual(get_model_for_task('issue_triage'), 'llama-3.3-70b-versatile')
-        self.assertEqual(get_model_for_task('community_qa'), 'llama-3.3-70b-versatile')
-        self.assertEqual(get_model_for_task('comment_response'), 'llama-3.3-70b-versatile')
+        self.assertEqual(config_constants.get_model_for_task('pr_review'), 'llama-3.3-70b-versatile')
+        self.assertEqual(config_constants.get_model_for_task('issue_triage'), 'llama-3.3-70b-versatile')
+        self.assertEqual(config_constants.get_model_for_task('community_qa'), 'llama-3.3-70b-versatile')
+        self.assertEqual(config_constants.get_model_for_task('comment_response'), 'llama-3.3-70b-versatile')
     
     def test_truncation_sizes(self):
         """Test log truncation size calculation"""
-        from config_constants import get_truncation_sizes, MAX_LOG_SIZE_BYTES
         
         # Small size - no truncation needed
-        head, tail = get_truncation_sizes(1000)
+        head, tail = config_constants.get_truncation_sizes(1000)
         self.assertEqual(head, 1000)
         self.assertEqual(tail, 0)
         
         # Large size - needs truncation
-        head, tail = get_truncation_sizes(MAX_LOG_SIZE_BYTES * 2)
+        head, tail = config_constants.get_truncation_sizes(config_constants.MAX_LOG_SIZE_BYTES * 2)
         self.assertTrue(head > 0)
         self.assertTrue(tail > 0)
-        self.assertTrue(head + tail < MAX_LOG_SIZE_BYTES)
-
+        self.assertTrue(head + tail < config_constants.MAX_LOG_SIZE_BYTES)
+    
+    def test_pick_model(self):
+        """Test size-based model routing and overrides"""
+        
+        large_input = 'x' * config_constants.SMALL_INPUT_CHARS
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(config_constants.pick_model('short', 'default-model'), 'default-model')
+        with patch.dict(os.environ, {'MODEL_SMALL': 'small-model'}, clear=True):
+            self.assertEqual(config_constants.pick_model('short', 'default-model'), 'small-model')
+            self.assertEqual(config_constants.pick_model(large_input, 'default-model'), 'default-model')
+        with patch.dict(os.environ, {'MODEL_SMALL': 'small-model', 'FORCE_MODEL': 'forced'}, clear=True):
+            self.assertEqual(config_constants.pick_model('short', 'default-model'), 'forced')
 
-# Run all tests
-if __name__ == '__main__':
-    # Create test suite
-    loader = unittest.TestLoader()
-    suite = unittest.TestSuite()
-    
-    # Add all test cases
-    suite.addTests(loader.loadTestsFromTestCase(TestPostReviewComments))
-    suite.addTests(loader.loadTestsFromTestCase(TestTriageIssue))
-    suite.addTests(loader.loadTestsFromTestCase(TestCICDAgent))
-    suite.addTests(loader.loadTestsFromTestCase(TestCommunityAssistant))
-    suite.addTests(loader.loadTestsFromTestCase(TestOrchestrator))
-    suite.addTests(loader.loadTestsFromTestCase(TestConfigConstants))
-    
-    # Run tests
-    runner = unittest.TextTestRunner(verbosity=2)
-    result = runner.run(suite)
-    
-    # Summary
-    print("\n" + "=" * 60)
-    if result.wasSuccessful():
-        print("✅ ALL INTEGRATION TESTS PASSED!")
-        print(f"   Ran {result.testsRun} tests successfully")
-    else:
-        print("❌ SOME TESTS FAILED")
-        print(f"   Failures: {len(result.failures)}")
-        print(f"   Errors: {len(result.errors)}")
-    print("=" * 60)
-    
-    sys.exit(0 if result.wasSuccessful() else 1)
@@ -3,29 +3,30 @@
 Multi-Agent System Test Suite
 Validates orchestrator, agents, and communication protocol.
 """
-import sys
-import json
-from pathlib import Path
-
-print("🧪 MULTI-AGENT SYSTEM TEST SUITE")
-print("=" * 60)
-
-# Test 1: Import all modules
-print("\n✅ TEST 1: Module Imports")
-try:
-    sys.path.insert(0, 'scripts')
-    from orchestrator import Orchestrator, Message, ContextStore, MessageQueue
-    from cicd_agent import CICDAgent, BuildLogAnalyzer
-    import agent_comms
-    import pr_reviewer_enhanced
-    print("  ✓ All modules imported successfully")
-except Exception as e:
-    print(f"  ✗ Import failed: {e}")
-    sys.exit(1)
-
-# Test 2: Message Creation and Serialization
-print("\n✅ TEST 2: Message System")
-try:
+from unittest.mock import MagicMock
+
+import pytest
+
+from orchestrator import Orchestrator, Message, ContextStore, MessageQueue
+from cicd_agent import CICDAgent, BuildLogAnalyzer
+import agent_comms
+import pr_reviewer_enhanced
+
+
+@pytest.fixture(scope="module")
+def analyzer():
+    return BuildLogAnalyzer()
+
+
+@pytest.fixture(scope="module")
+def orchestrator(tmp_path_factory):
+    # Orchestrator keeps its context store and queue under .repogent in the working directory
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(tmp_path_factory.mktemp('orchestrator'))
+        return Orchestrator()
+
+
+def test_message_serialization():
     msg = Message(
         sender='test_agent',
         receiver='orchestrator',
@@ -34,78 +35,41 @@ try:
     )
     msg_dict = msg.to_dict()
     msg_restored = Message.from_dict(msg_dict)
-    
+
     assert msg_restored.sender == 'test_agent'
     assert msg_restored.receiver == 'orchestrator'
     assert msg_restored.payload['key'] == 'value'
-    print("  ✓ Message serialization works")
-except Exception as e:
-    print(f"  ✗ Message test failed: {e}")
-    sys.exit(1)
-
-# Test 3: Context Store
-print("\n✅ TEST 3: Context Store")
-try:
-    store = ContextStore('.test_repogent/context')
+
+
+def test_context_store(tmp_path):
+    store = ContextStore(str(tmp_path / 'context'))
     store.save_context('test_pr_1', {'status': 'reviewed', 'score': 95})
     loaded = store.load_context('test_pr_1')
-    
+
     assert loaded['data']['status'] == 'reviewed'
     assert loaded['data']['score'] == 95
-    print("  ✓ Context storage works")
-    
-    # Cleanup
-    import shutil
-    from pathlib import Path
-    test_dir = Path('.test_repogent')
-    if test_dir.exists():
-        try:
-            shutil.rmtree(test_dir)
-        except Exception as e:
-            print(f"  ⚠️ Cleanup warning: {e}", file=sys.stderr)
-except Exception as e:
-    print(f"  ✗ Context store test failed: {e}")
-    sys.exit(1)
-
-# Test 4: Message Queue
-print("\n✅ TEST 4: Message Queue")
-try:
-    queue = MessageQueue('.test_repogent/queue')
-    
+
+
+def test_message_queue(tmp_path):
+    queue = MessageQueue(str(tmp_path / 'queue'))
+
     # Enqueue messages
     msg1 = Message('agent1', 'agent2', 'type1', {'data': 1})
     msg2 = Message('agent1', 'agent3', 'type2', {'data': 2})
     queue.enqueue(msg1)
     queue.enqueue(msg2)
-    
+
     # Dequeue for specific receiver
     received = queue.dequeue('agent2')
     assert received is not None
     assert received.payload['data'] == 1
-    
+
     # Check remaining
     remaining = queue.peek_all()
     assert len(remaining) == 1
-    print("  ✓ Message queue works")
-    
-    # Cleanup
-    import shutil
-    from pathlib import Path
-    test_dir = Path('.test_repogent')
-    if test_dir.exists():
-        try:
-            shutil.rmtree(test_dir)
-        except Exception as e:
-            print(f"  ⚠️ Cleanup warning: {e}", file=sys.stderr)
-except Exception as e:
-    print(f"  ✗ Message queue test failed: {e}")
-    sys.exit(1)
-
-# Test 5: Build Log Analyzer
-print("\n✅ TEST 5: Build Log Analyzer")
-try:
-    analyzer = BuildLogAnalyzer()
-    
+
+
+def test_build_log_analyzer(analyzer):
     # Test with sample logs
     test_logs = """
     Running tests...
@@ -114,116 +78,91 @@ try:
         Expected status 200, got 401
     Tests failed
     """
-    
+
     analysis = analyzer.analyze(test_logs)
-    
+
     assert analysis['failure_type'] == 'test_failure'
     assert len(analysis['suggestions']) > 0
     assert analysis['severity'] in ['CRITICAL', 'HIGH', 'MEDIUM']
-    print(f"  ✓ Build log analysis works (detected: {analysis['failure_type']})")
-except Exception as e:
-    print(f"  ✗ Build log analyzer test failed: {e}")
-    sys.exit(1)
-
-# Test 6: Event Routing
-print("\n✅ TEST 6: Event Routing")
-try:
-    orchestrator = Orchestrator()
-    
-    # Test different event types
-    assert orchestrator.route_event('pull_request', {}) == 'pr_reviewer'
-    assert orchestrator.route_event('issues', {}) == 'issue_manager'
-    assert orchestrator.route_event('workflow_run', {}) == 'cicd_agent'
-    
-    # Test comment routing with @repogent
-    event_data = {'comment': {'body': '@repogent how does this work?'}}
-    assert orchestrator.route_event('issue_comment', event_data) == 'community_assistant'
-    
-    print("  ✓ Event routing works correctly")
-except Exception as e:
-    print(f"  ✗ Event routing test failed: {e}")
-    sys.exit(1)
-
-# Test 7: Agent Registry
-print("\n✅ TEST 7: Agent Registry")
-try:
-    orchestrator = Orchestrator()
-    
-    agents = orchestrator.list_agents()
-    assert 'pr_reviewer' in agents
-    assert 'issue_manager' in agents
-    assert 'community_assistant' in agents
-    assert 'cicd_agent' in agents
-    
+
+
+@pytest.mark.parametrize("event_type,event_data,expected", [
+    ('pull_request', {}, 'pr_reviewer'),
+    ('issues', {}, 'issue_manager'),
+    ('workflow_run', {}, 'cicd_agent'),
+    ('issue_comment', {'comment': {'body': '@repogent how does this work?'}}, 'community_assistant'),
+])
+def test_event_routing(orchestrator, event_type, event_data, expected):
+    assert orchestrator.route_event(event_type, event_data) == expected
+
+
+@pytest.mark.parametrize("agent", ['pr_reviewer', 'issue_manager', 'community_assistant', 'cicd_agent'])
+def test_agent_registered(orchestrator, agent):
+    assert agent in orchestrator.list_agents()
+
+
+def test_agent_info(orchestrator):
     agent_info = orchestrator.get_agent_info('cicd_agent')
     assert agent_info is not None
     assert 'build_monitoring' in agent_info['capabilities']
-    
-    print(f"  ✓ Agent registry works ({len(agents)} agents registered)")
-except Exception as e:
-    print(f"  ✗ Agent registry test failed: {e}")
-    sys.exit(1)
-
-# Test 8: Error Pattern Detection
-print("\n✅ TEST 8: Error Pattern Detection")
-try:
-    analyzer = BuildLogAnalyzer()
-    
-    test_cases = [
-        ("Cannot find module 'axios'", 'dependency_error'),
-        ("SyntaxError: Unexpected token", 'compile_error'),
-        ("JavaScript heap out of memory", 'memory_error'),
-        ("docker: Error response from daemon", 'docker_error'),
-    ]
-    
-    for log_snippet, expected_type in test_cases:
-        detected = analyzer._detect_failure_type(log_snippet)
-        assert detected == expected_type, f"Expected {expected_type}, got {detected}"
-    
-    print(f"  ✓ Error pattern detection works ({len(test_cases)} patterns tested)")
-except Exception as e:
-    print(f"  ✗ Error pattern detection test failed: {e}")
-    sys.exit(1)
-
-# Test 9: Agent Communication Helpers
-print("\n✅ TEST 9: Agent Communication Helpers")
-try:
+
+
+@pytest.mark.parametrize("log_snippet,expected_type", [
+    ("Cannot find module 'axios'", 'dependency_error'),
+    ("SyntaxError: Unexpected token", 'compile_error'),
+    ("JavaScript heap out of memory", 'memory_error'),
+    ("docker: Error response from daemon", 'docker_error'),
+])
+def test_error_pattern_detection(analyzer, log_snippet, expected_type):
+    assert analyzer._detect_failure_type(log_snippet) == expected_type
+
+
+def test_agent_communication_helpers(tmp_path, monkeypatch):
+    # agent_comms keeps its queue under .repogent in the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(agent_comms, '_orchestrator_instance', None)
+
     # Test message sending (creates queue)
     agent_comms.send_message('test_agent', 'orchestrator', 'test', {'data': 'test'})
-    
+
     # Test message receiving
     messages = agent_comms.receive_messages('orchestrator')
     assert len(messages) >= 1
     assert messages[0].sender == 'test_agent'
-    
-    print("  ✓ Agent communication helpers work")
-    
-    # Cleanup - use correct test directory
-    import shutil
-    from pathlib import Path
-    test_dir = Path('.repogent')  # Actual queue directory used by agent_comms
-    if test_dir.exists():
-        try:
-            shutil.rmtree(test_dir)
-        except Exception as e:
-            print(f"  ⚠️ Cleanup warning: {e}", file=sys.stderr)
-except Exception as e:
-    print(f"  ✗ Agent communication test failed: {e}")
-    sys.exit(1)
-
-# Final Summary
-print("\n" + "=" * 60)
-print("✅ ALL 9 TESTS PASSED!")
-print("=" * 60)
-print("\n🎉 Multi-Agent System is fully functional!")
-print("\nValidated:")
-print("  • Orchestrator core functionality")
-print("  • Message queue and serialization")
-print("  • Context storage and retrieval")
-print("  • CI/CD agent log analysis")
-print("  • Event routing logic")
-print("  • Agent registry")
-print("  • Error pattern detection")
-print("  • Inter-agent communication")
-print("  • All module imports")
-print("\n✅ Ready for deployment!")
+
+
+def build_failure_messages(*pr_numbers):
+    return [Message('cicd_agent', 'pr_reviewer', 'analyze_build_failure',
+                    {'pr_number': pr_number, 'analysis': {'failure_type': 'test_failure'}})
+            for pr_number in pr_numbers]
+
+
+def test_cicd_messages_posted_concurrently(monkeypatch):
+    monkeypatch.setenv('GITHUB_TOKEN', 'fake-token')
+    monkeypatch.setenv('GITHUB_REPOSITORY', 'owner/repo')
+    monkeypatch.setattr(agent_comms, 'receive_messages', lambda agent: build_failure_messages(11, 12))
+    monkeypatch.setattr(agent_comms, 'get_context', lambda context_id: None)
+    log_decision = MagicMock()
+    monkeypatch.setattr(agent_comms, 'log_decision', log_decision)
+    post = MagicMock(return_value=MagicMock(status_code=201))
+    monkeypatch.setattr(pr_reviewer_enhanced._SESSION, 'post', post)
+
+    pr_reviewer_enhanced.check_for_cicd_messages()
+
+    urls = sorted(call.args[0] for call in post.call_args_list)
+    assert urls == ['https://api.github.com/repos/owner/repo/issues/11/comments',
+                    'https://api.github.com/repos/owner/repo/issues/12/comments']
+    assert sorted(call.args[1]['pr_number'] for call in log_decision.call_args_list) == [11, 12]
+
+
+def test_cicd_messages_without_credentials_warn(monkeypatch, capsys):
+    monkeypatch.delenv('GITHUB_TOKEN', raising=False)
+    monkeypatch.delenv('GITHUB_REPOSITORY', raising=False)
+    monkeypatch.setattr(agent_comms, 'receive_messages', lambda agent: build_failure_messages(11))
+    post = MagicMock()
+    monkeypatch.setattr(pr_reviewer_enhanced._SESSION, 'post', post)
+
+    pr_reviewer_enhanced.check_for_cicd_messages()
+
+    assert not post.called
+    assert 'dropping build failure notifications for PR #11' in capsys.readouterr().err